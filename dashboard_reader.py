@@ -1,9 +1,48 @@
 import os
 import sys
-from PIL import ImageDraw
+import pickle
+import functools
+from collections import namedtuple
+import numpy as np
+from PIL import Image
 import configparser
 
+from jit import njit
+from image_processing import scale_to_frame
+
+# One frame's worth of dashboard readings
+DashReading = namedtuple('DashReading', 'rpm boost temp fuel mph gear f_rollbar r_rollbar brake boost_knob')
+
+# Bump when the layout of the parsed result changes so stale caches are ignored
+CACHE_VERSION = 1
+
 def read_ini_to_numbers_and_rollbar(ini_file_path):
+    """Returns the parsed INI, reusing a pickled copy if the INI hasn't changed."""
+    cache_path = ini_file_path + '.cache'
+    stat = os.stat(ini_file_path)
+    key = (CACHE_VERSION, stat.st_mtime, stat.st_size)
+
+    # A missing, truncated or outdated cache can fail in many ways; any of them just means reparsing
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, result = pickle.load(f)
+        if cached_key == key:
+            return result
+    except Exception:
+        pass
+
+    result = parse_dash_reader_ini(ini_file_path)
+
+    try:
+        with open(cache_path, 'wb') as f:
+            pickle.dump((key, result), f)
+    except OSError:
+        print(f"Could not write dashboard reader cache file at: {cache_path}")
+
+    return result
+
+def parse_dash_reader_ini(ini_file_path):
+    """Parses the LCD segment, rollbar and boost knob coordinates from the INI."""
     config = configparser.ConfigParser()
     config.read(ini_file_path)
 
@@ -27,120 +66,176 @@ def read_ini_to_numbers_and_rollbar(ini_file_path):
         raise ValueError("Rollbar section is missing in the INI file.")
 
     # Boost knob
-    boost1_x, boost1_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_1').split(',')))
-    boost2_x, boost2_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_2').split(',')))
-    boost3_x, boost3_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_3').split(',')))
-    boost4_x, boost4_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_4').split(',')))
-    boost5_x, boost5_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_5').split(',')))
-    boost6_x, boost6_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_6').split(',')))
-    boost7_x, boost7_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_7').split(',')))
-    boost8_x, boost8_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_8').split(',')))
-    boost9_x, boost9_y = tuple(map(int, config.get('Boost knob', 'Boost_knob_9').split(',')))
-
-    boostxy = [(boost1_x, boost1_y),
-               (boost2_x, boost2_y),
-               (boost3_x, boost3_y),
-               (boost4_x, boost4_y),
-               (boost5_x, boost5_y),
-               (boost6_x, boost6_y),
-               (boost7_x, boost7_y),
-               (boost8_x, boost8_y),
-               (boost9_x, boost9_y),
-               ]
+    boostxy = [tuple(map(int, config.get('Boost knob', f'Boost_knob_{i}').split(','))) for i in range(1, 10)]
 
     return numbers, bars_x1, bars_x2, f_rollbar_y, r_rollbar_y, brake_y, boostxy
 
-# Define the coordinates for each segment of every number
-ini_file_path = "dash_reader.ini"
-print(f"Looking for dashboard reader config file at: {os.path.abspath(ini_file_path)}")
-if not os.path.exists(ini_file_path):
-    print("Configuration file not found!")
-    sys.exit(1)
-
-numbers, bars_x1, bars_x2, f_rollbar_y, r_rollbar_y, brake_y, boostxy = read_ini_to_numbers_and_rollbar(ini_file_path)
-
+LCD_SEGMENTS = 'abcdefg'
+
+# The rollbar and brake bars are read with nine probes each, one per bar
+# segment centre, sharing the same x coordinates.
+BAR_PROBES = 9
+
+def build_segment_arrays(numbers):
+    """Flattens the per-digit segment dicts into (digits, 7) x/y/valid arrays ordered a..g."""
+    seg_x = np.zeros((len(numbers), len(LCD_SEGMENTS)), dtype=np.int32)
+    seg_y = np.zeros((len(numbers), len(LCD_SEGMENTS)), dtype=np.int32)
+    seg_valid = np.zeros((len(numbers), len(LCD_SEGMENTS)), dtype=bool)
+    for digit, number in enumerate(numbers):
+        for segment, (x, y) in number.items():
+            index = LCD_SEGMENTS.index(segment)
+            seg_x[digit, index] = x
+            seg_y[digit, index] = y
+            seg_valid[digit, index] = True
+    return seg_x, seg_y, seg_valid
+
+# Probe coordinates built from dash_reader.ini
+ProbeLayout = namedtuple('ProbeLayout', 'seg_x seg_y seg_valid all_xs all_ys')
+
+def build_probe_layout(numbers, bars_x1, bars_x2, f_rollbar_y, r_rollbar_y, brake_y, boostxy):
+    """Builds the probe coordinate arrays from the parsed INI."""
+    seg_x, seg_y, seg_valid = build_segment_arrays(numbers)
+    probe_xs = (bars_x1 + ((bars_x2 - bars_x1) / 8) * (np.arange(BAR_PROBES) + 0.5)).astype(np.int32)
+    boost_xs = np.array([x for x, _ in boostxy], dtype=np.int32)
+    boost_ys = np.array([y for _, y in boostxy], dtype=np.int32)
+
+    # Every probe, concatenated so a frame can be sampled with a single gather:
+    # LCD segments, front rollbar, rear rollbar, brake, then boost knob.
+    all_xs = np.concatenate([seg_x.ravel(), probe_xs, probe_xs, probe_xs, boost_xs])
+    all_ys = np.concatenate([
+        seg_y.ravel(),
+        np.full(BAR_PROBES, f_rollbar_y, dtype=np.int32),
+        np.full(BAR_PROBES, r_rollbar_y, dtype=np.int32),
+        np.full(BAR_PROBES, brake_y, dtype=np.int32),
+        boost_ys,
+    ])
+    return ProbeLayout(seg_x, seg_y, seg_valid, all_xs, all_ys)
+
+def _bootstrap(ini_file_path='dash_reader.ini'):
+    """Loads the dashboard reader config, exiting if the INI is missing."""
+    print(f"Looking for dashboard reader config file at: {os.path.abspath(ini_file_path)}")
+    if not os.path.exists(ini_file_path):
+        print("Configuration file not found!")
+        sys.exit(1)
+    return build_probe_layout(*read_ini_to_numbers_and_rollbar(ini_file_path))
+
+_layout = None
+
+def get_config():
+    """Returns the probe layout, loading dash_reader.ini on first use."""
+    global _layout
+    if _layout is None:
+        _layout = _bootstrap()
+    return _layout
+
+# Bounded, since resizing the DOSBox window goes through many frame sizes
+@functools.lru_cache(maxsize=16)
+def get_frame_layout(width, height):
+    """Returns the probe layout mapped onto a width x height cropped frame."""
+    layout = get_config()
+    seg_x, seg_y = scale_to_frame(layout.seg_x, layout.seg_y, width, height)
+    all_xs, all_ys = scale_to_frame(layout.all_xs, layout.all_ys, width, height)
+    return layout._replace(seg_x=seg_x, seg_y=seg_y, all_xs=all_xs, all_ys=all_ys)
+
+# Lit segments of each LCD digit
 LCD_NUMBERS = {
-    frozenset(['a', 'b', 'c', 'd', 'e', 'f']): '0',
-    frozenset(['b', 'c']): '1',
-    frozenset(['a', 'b', 'g', 'e', 'd']): '2',
-    frozenset(['a', 'b', 'g', 'c', 'd']): '3',
-    frozenset(['f', 'g', 'b', 'c']): '4',
-    frozenset(['a', 'f', 'g', 'c', 'd']): '5',
-    frozenset(['a', 'f', 'g', 'e', 'c', 'd']): '6',
-    frozenset(['a', 'b', 'c']): '7',
-    frozenset(['a', 'b', 'c', 'd', 'e', 'f', 'g']): '8',
-    frozenset(['a', 'b', 'c', 'd', 'f', 'g']): '9'
+    'abcdef': 0,
+    'bc': 1,
+    'abged': 2,
+    'abgcd': 3,
+    'fgbc': 4,
+    'afgcd': 5,
+    'afgecd': 6,
+    'abc': 7,
+    'abcdefg': 8,
+    'abcdfg': 9,
 }
 
-def is_pixel_lit(pixel, threshold=128):
-    """Check if a pixel is 'lit' (dark in this case) based on a threshold."""
-    r, g, b = pixel
-    brightness = (r + g + b) / 3
-    return brightness < threshold
-
-def plot_lcd_locations(cropped_screenshot):
-    """Plots where the LCD locations are and returns a new PIL image"""
-    dash_plot = ImageDraw.Draw(cropped_screenshot)
-    for number in numbers:
-        coords = [coord for coord in number.values()]
-        for x, y in coords:
-            dash_plot.point((x, y), fill='red')
-
-    return cropped_screenshot
+# Segment a..g is bit 0..6 of a digit's mask
+SEGMENT_BITS = 1 << np.arange(len(LCD_SEGMENTS), dtype=np.uint8)
 
-def read_dashboard(cropped_screenshot):
-    """Read the numbers from the screenshot using the numbers list."""
-    pixels = cropped_screenshot.load()
-
-    readout = []
-
-    for number in numbers:
-        active_segments = []
+def segment_mask(segments):
+    """Packs a string of segment letters into a bitmask."""
+    return sum(1 << LCD_SEGMENTS.index(segment) for segment in segments)
 
-        for segment, coord in number.items():
-            if is_pixel_lit(pixels[coord[0], coord[1]]):
-                active_segments.append(segment)
+def build_lcd_lut(lcd_numbers):
+    """Builds a 128-entry table mapping a segment bitmask to its digit."""
+    lut = np.zeros(1 << len(LCD_SEGMENTS), dtype=np.int8)  # 0 is the placeholder for unidentified numbers
+    for segments, number in lcd_numbers.items():
+        lut[segment_mask(segments)] = number
+    return lut
 
-        number_identified = LCD_NUMBERS.get(frozenset(active_segments))
-        if number_identified:
-            readout.append(int(number_identified))
-        else:
-            readout.append(0)  # Placeholder for unidentified numbers
+LCD_LUT = build_lcd_lut(LCD_NUMBERS)
 
-    rpm = readout[3] * 1 + readout[2] * 10 + readout[1] * 100 + readout[0] * 1000
-    boost = readout[4] * 10 + readout[5] * 1
-    temp = readout[6] * 100 + readout[7] * 10 + readout[8] * 1
-    fuel = readout[9] * 10 + readout[10] * 1 + readout[11] * .1 + readout[12] * .01
-    mph = readout[13] * 100 + readout[14] * 10 + readout[15] * 1
-    gear = readout[16]
+# Place value of each digit, in the order the readouts appear in the INI
+RPM_W = np.array([1000, 100, 10, 1])
+BOOST_W = np.array([10, 1])
+TEMP_W = np.array([100, 10, 1])
+FUEL_W = np.array([10, 1, .1, .01])
+MPH_W = np.array([100, 10, 1])
 
-    seg_length = (bars_x2 - bars_x1) / 8
+# Channel sum below 3*LIT_THRESHOLD counts as lit (the LCD segments are dark)
+LIT_THRESHOLD = 128
 
-    f_rollbar = r_rollbar = brake = 0  # Initialize variables
-
-    for segment in range(0, 9):
-        f_rollbar_x = int(bars_x1 + seg_length * (segment + 0.5))
-        if not is_pixel_lit(pixels[f_rollbar_x, f_rollbar_y]):
-            f_rollbar = segment - 1
-            break
+def is_pixel_lit(pixel, threshold=LIT_THRESHOLD):
+    """Check if a pixel is 'lit' (dark in this case) based on a threshold."""
+    r, g, b = pixel[:3]
+    return r + g + b < 3 * threshold
 
-    for segment in range(0, 9):
-        r_rollbar_x = int(bars_x1 + seg_length * (segment + 0.5))
-        if not is_pixel_lit(pixels[r_rollbar_x, r_rollbar_y]):
-            r_rollbar = segment - 1
-            break
+def image_to_rgb_array(image):
+    """Returns an (h, w, 3) array view of a PIL image, converting it to RGB first if needed. Arrays are passed through."""
+    if isinstance(image, np.ndarray):
+        return image
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.asarray(image)
 
-    for segment in range(0, 9):
-        brake_x = int(bars_x1 + seg_length * (segment + 0.5))
-        if not is_pixel_lit(pixels[brake_x, brake_y]):
-            brake = segment - 1
-            break
+def plot_lcd_locations(cropped_screenshot):
+    """Plots where the LCD locations are and returns a new PIL image"""
+    dash_plot = image_to_rgb_array(cropped_screenshot).copy()
+    layout = get_frame_layout(dash_plot.shape[1], dash_plot.shape[0])
+    dash_plot[layout.seg_y[layout.seg_valid], layout.seg_x[layout.seg_valid]] = (255, 0, 0)
+    return Image.fromarray(dash_plot)
+
+@njit(cache=True, fastmath=True)
+def decode_probes(samples, seg_valid, lut, threshold3):
+    """Decodes the probe pixels gathered at the layout's all_ys, all_xs into the dashboard readouts."""
+    lit = (samples[:, 0].astype(np.int32) + samples[:, 1] + samples[:, 2]) < threshold3
+
+    digit_count = seg_valid.shape[0]
+    segment_lit = lit[:seg_valid.size].reshape(seg_valid.shape) & seg_valid
+    segment_masks = (segment_lit * SEGMENT_BITS).sum(axis=1)
+    digits = lut[segment_masks]
+
+    rpm = int((digits[0:4] * RPM_W).sum())
+    boost = int((digits[4:6] * BOOST_W).sum())
+    temp = int((digits[6:9] * TEMP_W).sum())
+    fuel = float((digits[9:13] * FUEL_W).sum())
+    mph = int((digits[13:16] * MPH_W).sum())
+    gear = int(digits[16])
+
+    bars_start = seg_valid.size
+    f_rollbar_lit = lit[bars_start:bars_start + BAR_PROBES]
+    r_rollbar_lit = lit[bars_start + BAR_PROBES:bars_start + 2 * BAR_PROBES]
+    brake_lit = lit[bars_start + 2 * BAR_PROBES:bars_start + 3 * BAR_PROBES]
+    boost_lit = lit[bars_start + 3 * BAR_PROBES:]
+
+    # Bars read as one less than the first unlit probe, or 0 if every probe is lit
+    f_rollbar = int(np.argmin(f_rollbar_lit)) - 1 if not f_rollbar_lit.all() else 0
+    r_rollbar = int(np.argmin(r_rollbar_lit)) - 1 if not r_rollbar_lit.all() else 0
+    brake = int(np.argmin(brake_lit)) - 1 if not brake_lit.all() else 0
+
+    # The boost knob is at the first lit probe, or 0 if none is lit
+    boost_knob = int(np.argmax(boost_lit)) + 1 if boost_lit.any() else 0
 
-    for boost_pos in range(0,9):
-        if is_pixel_lit(pixels[boostxy[boost_pos][0], boostxy[boost_pos][1]]):
-            boost_knob = boost_pos + 1
-            break
+    return rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_knob
 
-    #print (rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_knob)
+def read_dashboard(cropped_screenshot, threshold=LIT_THRESHOLD):
+    """Read the numbers from the screenshot using the numbers list."""
+    threshold3 = np.int32(3 * int(threshold))
+    arr = image_to_rgb_array(cropped_screenshot)
+    layout = get_frame_layout(arr.shape[1], arr.shape[0])
+    return DashReading(*decode_probes(arr[layout.all_ys, layout.all_xs], layout.seg_valid, LCD_LUT, threshold3))
 
-    return rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_knob
+if __name__ == '__main__':
+    get_config()
@@ -1,7 +1,13 @@
 import time
 
+NS_PER_SECOND = 1_000_000_000
+
 class GameState:
     """Holds and updates the game's current state."""
+    __slots__ = ('rpm', 'temp', 'fuel', 'mph', 'gear', 'cur_boost', 'f_rollbar', 'r_rollbar', 'brake',
+                 'last_update_ns', 'boost_drop_rate_per_second', 'boost_climb_rate_per_second',
+                 'boost_drop_per_ns', 'boost_climb_per_ns', 'boost_knob')
+
     def __init__(self):
         self.rpm = 0
         self.temp = 0
@@ -12,36 +18,45 @@ class GameState:
         self.f_rollbar = 0
         self.r_rollbar = 0
         self.brake = 0
-        self.last_update_time = time.time()
+        self.last_update_ns = time.monotonic_ns()
         self.boost_drop_rate_per_second = 0
         self.boost_climb_rate_per_second = 0
+        self.boost_drop_per_ns = 0
+        self.boost_climb_per_ns = 0
         self.boost_knob = 1
 
-    def update(self, rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_knob):
-        """Update the game state based on new readings."""
-        self.rpm = rpm
-        self.temp = temp
-        self.fuel = fuel
-        self.mph = mph
-        self.gear = gear
-        self.f_rollbar = f_rollbar
-        self.r_rollbar = r_rollbar
-        self.brake = brake
-        self.update_boost(boost)
-        self.boost_knob = boost_knob
+    def set_boost_rates(self, drop_rate_per_second, climb_rate_per_second):
+        """Sets how fast the displayed boost falls and rises towards the reading."""
+        self.boost_drop_rate_per_second = drop_rate_per_second
+        self.boost_climb_rate_per_second = climb_rate_per_second
+        self.boost_drop_per_ns = drop_rate_per_second / NS_PER_SECOND
+        self.boost_climb_per_ns = climb_rate_per_second / NS_PER_SECOND
+
+    def update(self, reading):
+        """Update the game state from a DashReading."""
+        self.rpm = reading.rpm
+        self.temp = reading.temp
+        self.fuel = reading.fuel
+        self.mph = reading.mph
+        self.gear = reading.gear
+        self.f_rollbar = reading.f_rollbar
+        self.r_rollbar = reading.r_rollbar
+        self.brake = reading.brake
+        self.update_boost(reading.boost)
+        self.boost_knob = reading.boost_knob
 
     def update_boost(self, boost_reading):
         """Adjusts the boost value based on the current reading."""
-        current_time = time.time()
-        time_delta = current_time - self.last_update_time
+        current_ns = time.monotonic_ns()
+        elapsed_ns = current_ns - self.last_update_ns
 
         if boost_reading < self.cur_boost:
-            self.cur_boost -= self.boost_drop_rate_per_second * time_delta
+            self.cur_boost -= self.boost_drop_per_ns * elapsed_ns
         elif boost_reading > self.cur_boost:
-            self.cur_boost += self.boost_climb_rate_per_second * time_delta
+            self.cur_boost += self.boost_climb_per_ns * elapsed_ns
 
         # Reset boost if deviation is significant
         if abs(boost_reading - self.cur_boost) > 15:
             self.cur_boost = boost_reading
 
-        self.last_update_time = current_time
+        self.last_update_ns = current_ns
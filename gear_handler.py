@@ -2,170 +2,389 @@ import keyboard
 import pygame
 import time
 import threading
-from enum import Enum
-from utils import play_gear_grinding_sound, stop_gear_grinding_sound
+import ctypes
+import logging
+from utils import load_sound, play_gear_grinding_sound, stop_gear_grinding_sound
+
+logger = logging.getLogger(__name__)
+
+try:
+    _user32 = ctypes.windll.user32
+    _user32.GetAsyncKeyState.restype = ctypes.c_short
+    _user32.VkKeyScanW.restype = ctypes.c_short
+    _kernel32 = ctypes.windll.kernel32
+except AttributeError:
+    _user32 = None  # Not on Windows, fall back to the keyboard library
+    _kernel32 = None
+
+MAPVK_VK_TO_VSC = 0
+MAPVK_VSC_TO_VK = 1
+THREAD_PRIORITY_ABOVE_NORMAL = 1
+INPUT_KEYBOARD = 1
+KEYEVENTF_EXTENDEDKEY = 0x0001
+KEYEVENTF_KEYUP = 0x0002
+
+# Virtual keys that sit on the extended part of the keyboard: page up/down,
+# end, home, arrows, insert, delete, numpad divide, right ctrl and right alt
+EXTENDED_VKS = frozenset((0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x2D, 0x2E, 0x6F, 0xA3, 0xA5))
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [('dx', ctypes.c_long), ('dy', ctypes.c_long), ('mouseData', ctypes.c_ulong),
+                ('dwFlags', ctypes.c_ulong), ('time', ctypes.c_ulong), ('dwExtraInfo', ctypes.c_size_t)]
+
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = [('wVk', ctypes.c_ushort), ('wScan', ctypes.c_ushort), ('dwFlags', ctypes.c_ulong),
+                ('time', ctypes.c_ulong), ('dwExtraInfo', ctypes.c_size_t)]
+
+class HARDWAREINPUT(ctypes.Structure):
+    _fields_ = [('uMsg', ctypes.c_ulong), ('wParamL', ctypes.c_ushort), ('wParamH', ctypes.c_ushort)]
+
+class INPUT(ctypes.Structure):
+    # SendInput checks cbSize, so the union has to include the larger mouse input too
+    class _INPUT(ctypes.Union):
+        _fields_ = [('mi', MOUSEINPUT), ('ki', KEYBDINPUT), ('hi', HARDWAREINPUT)]
+    _anonymous_ = ('input',)
+    _fields_ = [('type', ctypes.c_ulong), ('input', _INPUT)]
+
+def raise_thread_priority():
+    """Runs the calling thread above normal priority so Qt repaints don't delay shifts."""
+    if _kernel32 is not None:
+        _kernel32.SetThreadPriority(_kernel32.GetCurrentThread(), THREAD_PRIORITY_ABOVE_NORMAL)
+
+def key_to_vk(key):
+    """Returns the Win32 virtual-key code for a key name, or None if it can't be mapped."""
+    if _user32 is None:
+        return None
+    if len(key) == 1:
+        vk = _user32.VkKeyScanW(ord(key))
+        if vk != -1:
+            return vk & 0xFF
+    try:
+        scan_codes = keyboard.key_to_scan_codes(key)
+    except ValueError:
+        return None
+    vk = _user32.MapVirtualKeyW(scan_codes[0], MAPVK_VSC_TO_VK) if scan_codes else 0
+    return vk or None
+
+def key_send_code(key):
+    """Returns the scan code keyboard.send should use for a key, or the key name if it has none."""
+    try:
+        return keyboard.key_to_scan_codes(key)[0]
+    except (ValueError, IndexError):
+        return key
+
+def key_press_sender(key):
+    """Returns a function that presses and releases the key, as a single SendInput call on Windows."""
+    vk = key_to_vk(key)
+    if vk is None:
+        code = key_send_code(key)
+        return lambda: keyboard.send(code)
+
+    scan = _user32.MapVirtualKeyW(vk, MAPVK_VK_TO_VSC)
+    flags = KEYEVENTF_EXTENDEDKEY if vk in EXTENDED_VKS else 0
+    inputs = (INPUT * 2)()
+    for event, key_up in zip(inputs, (0, KEYEVENTF_KEYUP)):
+        event.type = INPUT_KEYBOARD
+        event.ki.wVk = vk
+        event.ki.wScan = scan
+        event.ki.dwFlags = flags | key_up
+    send_input = _user32.SendInput
+    input_size = ctypes.sizeof(INPUT)
+    return lambda: send_input(len(inputs), inputs, input_size)
+
+def key_down_check(key):
+    """Returns a function that tells whether the key is currently held down."""
+    vk = key_to_vk(key)
+    if vk is None:
+        return lambda: keyboard.is_pressed(key)
+    get_async_key_state = _user32.GetAsyncKeyState
+    return lambda: get_async_key_state(vk) & 0x8000
+
+# Where the clutch listener takes its next target gear from
+TARGET_NEUTRAL = 0
+TARGET_PRESSED = 1
+TARGET_KEEP = 2
+
+# The clutch listener's state table is indexed by
+# in_gear << 3 | clutch << 2 | gears_grind << 1 | target_is_neutral, and each
+# entry is (target source, new gears_grind, release shift lock, grinding now).
+def build_clutch_transitions():
+    """Builds the clutch listener's state table from the shifting rules."""
+    transitions = []
+    for key in range(16):
+        in_gear, clutch, gears_grind, target_is_neutral = (bool(key & bit) for bit in (8, 4, 2, 1))
+        target_source = TARGET_KEEP
+
+        # If the shifter is put into neutral for any reason, release the
+        # lock on shifting.
+        release_lock = target_is_neutral
+
+        # If the shifter is put into neutral, then set the target gear to
+        # zero (or neutral). If gears were grinding, then stop gears grinding.
+        if not in_gear:
+            target_source = TARGET_NEUTRAL
+            gears_grind = False
+
+        # If the shifter is in gear, and shifter was previously in neutral
+        # (i.e. target gear is zero), and the clutch is not pressed, then
+        # start the gears grinding.
+        grinding = in_gear and not clutch and target_is_neutral
+        if grinding:
+            gears_grind = True
+
+        # If the shifter is in gear, and clutch is engaged, and the gears
+        # are not already grinding from a previous inappropriate shift,
+        # then set the target gear to the selected shifter gear. Note this
+        # does not send the key to the game to shift yet - that only happens
+        # when the clutch is released.
+        if in_gear and clutch and not gears_grind:
+            target_source = TARGET_PRESSED
+
+        transitions.append((target_source, gears_grind, release_lock, grinding))
+    return tuple(transitions)
+
+CLUTCH_TRANSITIONS = build_clutch_transitions()
 
 class GearHandler:
-    def __init__(self, game_state, config, overlay_handler):
+    def __init__(self, game_state, settings, overlay_handler):
         self.gs = game_state
         self.overlay_handler = overlay_handler
-        self.config = config
+        self.settings = settings
+        shifting = settings['Gear shifting']
 
-        self.gear_lock = threading.Lock()
         self.target_gear = 1
-        self.clutch_engaged = False
         self.gears_grind = False
-        self.last_gear_change = 1
 
         # Initialize pygame mixer
-        pygame.mixer.init()
-        self.gear_grinding_sound = pygame.mixer.Sound("assets/sounds/shfterr.wav")
-        self.gear_grinding_sound.set_volume(config.getfloat('Gear shifting', 'gear_grinding_volume'))
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        self.gear_grinding_sound = load_sound("assets/sounds/shfterr.wav")
+        self.gear_grinding_sound.set_volume(shifting['gear_grinding_volume'])
         self.gear_grinding_channel = pygame.mixer.Channel(0)
 
-        self.shifter_gear1_key = config.get('Gear shifting', 'shifter_gear1_key')
-        self.shifter_gear2_key = config.get('Gear shifting', 'shifter_gear2_key')
-        self.shifter_gear3_key = config.get('Gear shifting', 'shifter_gear3_key')
-        self.shifter_gear4_key = config.get('Gear shifting', 'shifter_gear4_key')
-        self.shifter_gear5_key = config.get('Gear shifting', 'shifter_gear5_key')
-        self.shifter_gear6_key = config.get('Gear shifting', 'shifter_gear6_key')
-
-        self.hshifter_on = config.get('Gear shifting', 'hshifter').lower() == 'on'
-        self.clutch_on = config.get('Gear shifting', 'clutch').lower() == 'on'
-
-        self.clutch_key = config.get('Gear shifting', 'clutch_key')
-        self.upshift_delay = config.getfloat('Gear shifting', 'upshift_delay')
-        self.downshift_delay = config.getfloat('Gear shifting', 'downshift_delay')
-        self.key_listener_delay = config.getfloat('General', 'key_listener_delay')
-        self.icr2_shiftup_key = config.get('Gear shifting','icr2_shiftup_key')
-        self.icr2_shiftdown_key = config.get('Gear shifting','icr2_shiftdown_key')
-
-        print("GearHandler initialized with the following settings:")
-        print (f"  shifter_gear1_key: {self.shifter_gear1_key}")
-        print (f"  shifter_gear2_key: {self.shifter_gear2_key}")
-        print (f"  shifter_gear3_key: {self.shifter_gear3_key}")
-        print (f"  shifter_gear4_key: {self.shifter_gear4_key}")
-        print (f"  shifter_gear5_key: {self.shifter_gear5_key}")
-        print (f"  shifter_gear6_key: {self.shifter_gear6_key}")
-        print(f"  clutch_key: {self.clutch_key}")
-        print (f"  icr2_shiftup_key: {self.icr2_shiftup_key}")
-        print (f"  icr2_shiftdown_key: {self.icr2_shiftdown_key}")
-        print(f"  upshift_delay: {self.upshift_delay}")
-        print(f"  downshift_delay: {self.downshift_delay}")
-        print(f"  key_listener_delay: {self.key_listener_delay}")
-        print(f"  H-shifter on: {self.hshifter_on}")
-        print(f"  Clutch on: {self.clutch_on}")
-
-    def send_keypress(self, key):
-        """Send a keypress to the system."""
-        keyboard.send(key)
+        self.shifter_gear1_key = shifting['shifter_gear1_key']
+        self.shifter_gear2_key = shifting['shifter_gear2_key']
+        self.shifter_gear3_key = shifting['shifter_gear3_key']
+        self.shifter_gear4_key = shifting['shifter_gear4_key']
+        self.shifter_gear5_key = shifting['shifter_gear5_key']
+        self.shifter_gear6_key = shifting['shifter_gear6_key']
+
+        self.hshifter_on = shifting['hshifter']
+        self.clutch_on = shifting['clutch']
+
+        self.clutch_key = shifting['clutch_key']
+        self.upshift_delay = shifting['upshift_delay']
+        self.downshift_delay = shifting['downshift_delay']
+        self.key_listener_delay = settings['General']['key_listener_delay']
+        self.icr2_shiftup_key = shifting['icr2_shiftup_key']
+        self.icr2_shiftdown_key = shifting['icr2_shiftdown_key']
+
+        # Resolve the ICR2 shift keys once instead of on every press
+        self.send_shiftup = key_press_sender(self.icr2_shiftup_key)
+        self.send_shiftdown = key_press_sender(self.icr2_shiftdown_key)
+
+        # Pick the listener loop once rather than branching on clutch_on inside it
+        if self.clutch_on:
+            self.gear_change_listener = self._listener_clutch
+        else:
+            self.gear_change_listener = self._listener_noclutch
+
+        # Shifter keys for gears 1 to 6, in order
+        self.gear_keys = (self.shifter_gear1_key, self.shifter_gear2_key, self.shifter_gear3_key,
+                          self.shifter_gear4_key, self.shifter_gear5_key, self.shifter_gear6_key)
+
+        # Resolve the shifter and clutch keys once so polling reads the key state directly
+        self.gear_key_checks = tuple(key_down_check(key) for key in self.gear_keys)
+        self.clutch_key_down = key_down_check(self.clutch_key)
+
+        # The listener thread is started once and paused while the cockpit isn't shown
+        self.listening = False
+        self.listening_changed = threading.Condition()
+
+        # Wake the listener as soon as a shifter or clutch key changes state
+        self._wake = threading.Event()
+        for key in self.gear_keys + (self.clutch_key,):
+            keyboard.on_press_key(key, self.wake)
+            keyboard.on_release_key(key, self.wake)
+
+        logger.debug("GearHandler initialized with the following settings:")
+        logger.debug("  shifter_gear1_key: %s", self.shifter_gear1_key)
+        logger.debug("  shifter_gear2_key: %s", self.shifter_gear2_key)
+        logger.debug("  shifter_gear3_key: %s", self.shifter_gear3_key)
+        logger.debug("  shifter_gear4_key: %s", self.shifter_gear4_key)
+        logger.debug("  shifter_gear5_key: %s", self.shifter_gear5_key)
+        logger.debug("  shifter_gear6_key: %s", self.shifter_gear6_key)
+        logger.debug("  clutch_key: %s", self.clutch_key)
+        logger.debug("  icr2_shiftup_key: %s", self.icr2_shiftup_key)
+        logger.debug("  icr2_shiftdown_key: %s", self.icr2_shiftdown_key)
+        logger.debug("  upshift_delay: %s", self.upshift_delay)
+        logger.debug("  downshift_delay: %s", self.downshift_delay)
+        logger.debug("  key_listener_delay: %s", self.key_listener_delay)
+        logger.debug("  H-shifter on: %s", self.hshifter_on)
+        logger.debug("  Clutch on: %s", self.clutch_on)
+
+    def send_shifts(self, send_shift, num_shifts, delay, stop_event):
+        """Send a shift num_shifts times, delay seconds apart, stopping early if stop_event is set."""
+        deadline = time.perf_counter()
+        for _ in range(num_shifts):
+            send_shift()
+            deadline += delay
+            if stop_event.wait(max(0, deadline - time.perf_counter())) or not self.listening:
+                return
+
+    def wake(self, event=None):
+        """Wake the listener so it re-checks the keys and its stop event."""
+        self._wake.set()
+
+    def set_listening(self, listening):
+        """Pause or resume the listener thread."""
+        with self.listening_changed:
+            self.listening = listening
+            self.listening_changed.notify_all()
+        self.wake()
+
+    def wait_until_listening(self, stop_event):
+        """Blocks while the listener is paused, returning False if stop_event was set instead."""
+        with self.listening_changed:
+            self.listening_changed.wait_for(lambda: self.listening or stop_event.is_set())
+        return not stop_event.is_set()
 
     def detect_pressed_gear(self):
         """Detect which shifter gear key is currently pressed."""
-        if keyboard.is_pressed(self.shifter_gear1_key):
-            return 1
-        if keyboard.is_pressed(self.shifter_gear2_key):
-            return 2
-        if keyboard.is_pressed(self.shifter_gear3_key):
-            return 3
-        if keyboard.is_pressed(self.shifter_gear4_key):
-            return 4
-        if keyboard.is_pressed(self.shifter_gear5_key):
-            return 5
-        if keyboard.is_pressed(self.shifter_gear6_key):
-            return 6
+        for gear, key_down in enumerate(self.gear_key_checks, 1):
+            if key_down():
+                return gear
         return 0
 
-    def gear_change_listener(self, gs, stop_event):
+    def _listener_clutch(self, gs, stop_event):
+        """Gear listener for the H-shifter with the clutch required to shift."""
 
+        raise_thread_priority()
         self.lock_shift = False
 
-        if self.clutch_on:
-            while not stop_event.is_set():
+        # Bind settings and helpers to locals for the polling loop
+        detect_pressed_gear = self.detect_pressed_gear
+        clutch_key_down = self.clutch_key_down
+        send_shifts = self.send_shifts
+        send_shiftup = self.send_shiftup
+        send_shiftdown = self.send_shiftdown
+        up_delay = self.upshift_delay
+        down_delay = self.downshift_delay
+        # Without key events, still re-check at this interval so game gear changes are seen
+        key_listener_delay = self.key_listener_delay
+        grinding_channel = self.gear_grinding_channel
+        grinding_sound = self.gear_grinding_sound
+        is_set = stop_event.is_set
+        wait_for_key = self._wake.wait
+        clear_wake = self._wake.clear
+        clutch_transitions = CLUTCH_TRANSITIONS
 
-                # Detect if shifter gear key is pressed
-                self.pressed_gear = self.detect_pressed_gear()
+        while not is_set():
 
-                # Detect if clutch is pressed
-                if keyboard.is_pressed(self.clutch_key):
-                    self.clutch_engaged = True
-                else:
-                    self.clutch_engaged = False
-
-                #print (f'Gear: {self.pressed_gear} Clutch: {self.clutch_engaged} Gear grinding: {self.gears_grind} Target gear: {self.target_gear}')            
-
-                # If the shifter is put into neutral for any reason, release the
-                # lock on shifting.
-                if self.target_gear == 0:
-                    self.lock_shift = False
-
-                # If the shifter is put into neutral, then set the target gear to
-                # zero (or neutral). If gears were grinding, then stop gears grinding.
-                if self.pressed_gear == 0:
-                    self.target_gear = 0
-                    self.gears_grind = False
-                    stop_gear_grinding_sound(self.gear_grinding_channel)
-
-                # If the shifter is in gear, and shifter was previously in neutral
-                # (i.e. target gear is zero), and the clutch is not pressed, then
-                # start the gears grinding.
-                if self.pressed_gear > 0 and not self.clutch_engaged and self.target_gear == 0:
-                    self.gears_grind = True
-                    play_gear_grinding_sound(self.gear_grinding_channel, self.gear_grinding_sound)
-
-                # If the shifter is in gear, and clutch is engaged, and the gears
-                # are not already grinding from a previous inappropriate shift,
-                # then set the target gear to the selected shifter gear. Note this
-                # does not send the key to the game to shift yet - that only happens
-                # when the clutch is released.
-                if self.pressed_gear > 0 and self.clutch_engaged and not self.gears_grind:
-                    self.target_gear = self.pressed_gear
-
-                if not self.clutch_engaged and self.target_gear > 0 and not self.lock_shift:
-                    #print (f'Gear: {self.pressed_gear} | Clutch: {self.clutch_engaged} | Gear grinding: {self.gears_grind} | Target gear: {self.target_gear} | Game gear: {gs.gear}')
-                    
-                    if self.target_gear > gs.gear:
-                        num_shifts = self.target_gear - gs.gear
-                        self.lock_shift = True
-                        #print (f'Sending {num_shifts} upshift(s) from {gs.gear} to {self.target_gear}')
-                        for _ in range(0, num_shifts):
-                            self.send_keypress(self.icr2_shiftup_key)
-                            time.sleep(self.upshift_delay)
-                    elif self.target_gear < gs.gear:
-                        num_shifts = gs.gear - self.target_gear
-                        self.lock_shift = True
-                        #print (f'Sending {num_shifts} downshift(s) from {gs.gear} to {self.target_gear}')
-                        for _ in range(0, num_shifts):
-                            self.send_keypress(self.icr2_shiftdown_key)
-                            time.sleep(self.downshift_delay)
-                    else:
-                        self.lock_shift = True
-                        #print ('Same gear - no shift')
-                
-                time.sleep(self.key_listener_delay)
-        else:
-            while not stop_event.is_set():
-
-                # Detect if shifter gear key is pressed
-                self.pressed_gear = self.detect_pressed_gear()
-                if self.pressed_gear > 0:
-                    self.target_gear = self.pressed_gear
-
-                if self.target_gear == gs.gear:
-                    self.lock_shift = False
-
-                if not self.lock_shift:
-                    if self.target_gear > gs.gear:
-                        num_shifts = self.target_gear - gs.gear
-                        self.lock_shift = True
-                        for _ in range(0, num_shifts):
-                            self.send_keypress(self.icr2_shiftup_key)
-                            time.sleep(self.upshift_delay)
-                    elif self.target_gear < gs.gear:
-                        num_shifts = gs.gear - self.target_gear
-                        self.lock_shift = True
-                        for _ in range(0, num_shifts):
-                            self.send_keypress(self.icr2_shiftdown_key)
-                            time.sleep(self.downshift_delay)
+            if not self.listening:
+                # Don't leave the grinding sound playing while paused
+                if self.gears_grind:
+                    stop_gear_grinding_sound(grinding_channel)
+                if not self.wait_until_listening(stop_event):
+                    break
+                self.lock_shift = False
+
+            # Clear before polling, so a key event from here on wakes the next wait
+            clear_wake()
+
+            # Detect if shifter gear key is pressed
+            pressed_gear = detect_pressed_gear()
+
+            # Detect if clutch is pressed
+            clutch_engaged = bool(clutch_key_down())
+
+            #print (f'Gear: {pressed_gear} Clutch: {clutch_engaged} Gear grinding: {self.gears_grind} Target gear: {self.target_gear}')            
+
+            # Look up what this combination of shifter, clutch, grinding and
+            # target gear does (see build_clutch_transitions)
+            was_grinding = self.gears_grind
+            target_source, self.gears_grind, release_lock, grinding = clutch_transitions[
+                (pressed_gear > 0) << 3 | clutch_engaged << 2 | self.gears_grind << 1 | (self.target_gear == 0)]
+            if release_lock:
+                self.lock_shift = False
+            self.target_gear = (0, pressed_gear, self.target_gear)[target_source]
+
+            # Only touch the mixer while grinding, or to cut the sound off
+            # once the shifter returns to neutral. Pressing the clutch while
+            # still in gear lets the current clip finish.
+            if grinding:
+                play_gear_grinding_sound(grinding_channel, grinding_sound)
+            elif was_grinding and not self.gears_grind:
+                stop_gear_grinding_sound(grinding_channel)
+
+            if not clutch_engaged and self.target_gear > 0 and not self.lock_shift:
+                #print (f'Gear: {pressed_gear} | Clutch: {clutch_engaged} | Gear grinding: {self.gears_grind} | Target gear: {self.target_gear} | Game gear: {gs.gear}')
                 
-                time.sleep(self.key_listener_delay)
\ No newline at end of file
+                if self.target_gear > gs.gear:
+                    num_shifts = self.target_gear - gs.gear
+                    self.lock_shift = True
+                    #print (f'Sending {num_shifts} upshift(s) from {gs.gear} to {self.target_gear}')
+                    send_shifts(send_shiftup, num_shifts, up_delay, stop_event)
+                elif self.target_gear < gs.gear:
+                    num_shifts = gs.gear - self.target_gear
+                    self.lock_shift = True
+                    #print (f'Sending {num_shifts} downshift(s) from {gs.gear} to {self.target_gear}')
+                    send_shifts(send_shiftdown, num_shifts, down_delay, stop_event)
+                else:
+                    self.lock_shift = True
+                    #print ('Same gear - no shift')
+            
+            wait_for_key(key_listener_delay)
+
+        # Don't leave the grinding sound playing after the listener stops
+        if self.gears_grind:
+            stop_gear_grinding_sound(grinding_channel)
+
+    def _listener_noclutch(self, gs, stop_event):
+        """Gear listener for the H-shifter without a clutch."""
+
+        raise_thread_priority()
+        self.lock_shift = False
+
+        # Bind settings and helpers to locals for the polling loop
+        detect_pressed_gear = self.detect_pressed_gear
+        send_shifts = self.send_shifts
+        send_shiftup = self.send_shiftup
+        send_shiftdown = self.send_shiftdown
+        up_delay = self.upshift_delay
+        down_delay = self.downshift_delay
+        # Without key events, still re-check at this interval so game gear changes are seen
+        key_listener_delay = self.key_listener_delay
+        is_set = stop_event.is_set
+        wait_for_key = self._wake.wait
+        clear_wake = self._wake.clear
+
+        while not is_set():
+
+            if not self.listening:
+                if not self.wait_until_listening(stop_event):
+                    break
+                self.lock_shift = False
+
+            # Clear before polling, so a key event from here on wakes the next wait
+            clear_wake()
+
+            # Detect if shifter gear key is pressed
+            pressed_gear = detect_pressed_gear()
+            if pressed_gear > 0:
+                self.target_gear = pressed_gear
+
+            if self.target_gear == gs.gear:
+                self.lock_shift = False
+
+            if not self.lock_shift:
+                if self.target_gear > gs.gear:
+                    num_shifts = self.target_gear - gs.gear
+                    self.lock_shift = True
+                    send_shifts(send_shiftup, num_shifts, up_delay, stop_event)
+                elif self.target_gear < gs.gear:
+                    num_shifts = gs.gear - self.target_gear
+                    self.lock_shift = True
+                    send_shifts(send_shiftdown, num_shifts, down_delay, stop_event)
+            
+            wait_for_key(key_listener_delay)
\ No newline at end of file
@@ -1,14 +1,23 @@
 import sys
 import configparser
 from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import QTimer
-import os
+import logging
+from pathlib import Path
 
 from game_state import GameState
 from overlay_handler import OverlayHandler
-from utils import read_cockpit_pixels, play_gear_grinding_sound, stop_gear_grinding_sound
+from utils import read_settings, read_cockpit_pixels, play_gear_grinding_sound, stop_gear_grinding_sound
+
+# This app's module loggers, the only ones --verbose turns up to DEBUG
+APP_LOGGERS = ('gear_handler', 'overlay_handler')
 
 def main():
+    # Settings dumps and other diagnostics are only shown with --verbose
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    if '--verbose' in sys.argv:
+        for name in APP_LOGGERS:
+            logging.getLogger(name).setLevel(logging.DEBUG)
+
     print('ICR2 cockpit overlay script started - v2.0')
     print('Configurations can be edited in icr2dash.ini, overlay.ini and dash_reader.ini')
     print('Leave this program running in the background when you run ICR2 in DOSBox')
@@ -17,31 +26,30 @@ def main():
     print('   Ctrl-L to lock the DOSBox window location (prevents errors in black tunnels)')
 
     # Initialize global variables
-    config_path = 'icr2dash.ini'
-    print(f"Loading config file at: {os.path.abspath(config_path)}")
-    
-    if not os.path.exists(config_path):
+    config_path = Path('icr2dash.ini')
+    print(f"Loading config file at: {config_path.absolute()}")
+
+    try:
+        config_text = config_path.read_text()
+    except FileNotFoundError:
         print("Configuration file not found!")
         sys.exit(1)
 
     config = configparser.ConfigParser()
-    config.read(config_path)
+    config.read_string(config_text, source=str(config_path))
+    settings = read_settings(config)
 
     gs = GameState()
-    cockpit_pixels = read_cockpit_pixels(config_path)
+    cockpit_pixels = read_cockpit_pixels(settings)
 
-    overlay_handler = OverlayHandler(gs, cockpit_pixels, config)
+    overlay_handler = OverlayHandler(gs, cockpit_pixels, settings)
     
-    # Set up application context and overlay interface
+    # Set up application context and overlay interface. The overlay is then
+    # updated whenever the capture thread signals a new frame, at loop_ms
+    # while in the cockpit and at the idle rate otherwise
     app = QApplication(sys.argv)
     overlay_handler.setup_overlay(app)
 
-    
-    # Create a timer to regularly update the game state and overlay
-    timer = QTimer()
-    timer.timeout.connect(overlay_handler.update_loop)  # Connect the timer to the update loop function
-    timer.start(config.getint('General', 'loop_ms'))  # Set the timer to trigger every 16 milliseconds (~60fps) for smooth updates
-
     print ('ICR2dash has finished loading, now waiting for ICR2 to start')
 
     # Start the Qt event loop, which handles GUI events and updates until the application exits
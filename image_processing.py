@@ -1,19 +1,44 @@
 from PIL import Image
 import numpy as np
+import functools
 
-def is_in_cockpit_view(cropped_screenshot, pixel_color_mapping, tolerance=3):
+# The dashboard and cockpit detection coordinates in the INI files are for
+# the cropped frame upscaled to this size
+REFERENCE_WIDTH = 1280
+REFERENCE_HEIGHT = 960
+
+@functools.lru_cache(maxsize=32)
+def nearest_source_index(size, reference_size):
     """
-    Checks if the cropped screenshot is in the cockpit view based on specific pixel colors with a tolerance.
+    For each pixel of a NEAREST resize from size to reference_size pixels, returns the source pixel it is copied from.
     """
-    
-    def is_color_close(color1, color2, tol):
-        return all(abs(c1 - c2) <= tol for c1, c2 in zip(color1, color2))
+    # Resize an image of its own indices so the mapping matches PIL's rounding exactly
+    indices = np.arange(size, dtype=np.int32).reshape(1, size)
+    return np.asarray(Image.fromarray(indices).resize((reference_size, 1), Image.NEAREST))[0]
 
-    for coord, expected_color in pixel_color_mapping.items():
-        pixel_color = cropped_screenshot.getpixel(coord)
-        if not is_color_close(pixel_color[:3], expected_color, tolerance):  # Compare only RGB values, ignore alpha if present
-            return False
-    return True
+def scale_to_frame(xs, ys, width, height):
+    """
+    Maps reference coordinates onto a width x height frame, picking the pixels an upscale to the reference size would have shown there.
+    """
+    return nearest_source_index(width, REFERENCE_WIDTH)[xs], nearest_source_index(height, REFERENCE_HEIGHT)[ys]
+
+def build_cockpit_probes(pixel_color_mapping):
+    """
+    Turns the {(x, y): (r, g, b)} cockpit pixel mapping into the y, x and expected colour arrays used by is_in_cockpit_view.
+    """
+    ys = np.array([y for _, y in pixel_color_mapping], dtype=np.intp)
+    xs = np.array([x for x, _ in pixel_color_mapping], dtype=np.intp)
+    expected_colors = np.array(list(pixel_color_mapping.values()), dtype=np.int16).reshape(-1, 3)
+    return ys, xs, expected_colors
+
+def is_in_cockpit_view(frame, cockpit_probes, tolerance=3):
+    """
+    Checks if the cropped frame (an HxWx3 or HxWx4 array) is in the cockpit view based on specific pixel colors with a tolerance.
+    """
+    ys, xs, expected_colors = cockpit_probes
+    xs, ys = scale_to_frame(xs, ys, frame.shape[1], frame.shape[0])
+    pixel_colors = frame[ys, xs, :3].astype(np.int16)  # Compare only RGB values, ignore alpha if present
+    return bool(np.all(np.abs(pixel_colors - expected_colors) <= tolerance))
 
 
 def resize_image(image, width, height):
@@ -40,36 +65,35 @@ def crop_to_aspect_ratio(image, aspect_ratio=4/3):
         top = (img_height - new_height) // 2
         return image.crop((0, top, img_width, top + new_height))
 
-def crop_black_borders_with_coords(image, specific_crop_box=None):
-    # Convert image to grayscale
-    grayscale = image.convert("L")
-    
-    # Convert to numpy array and find non-black rows and columns
-    np_img = np.array(grayscale)
-    non_empty_columns = np.where(np_img.max(axis=0) > 0)[0]
-    non_empty_rows = np.where(np_img.max(axis=1) > 0)[0]
-    
+def crop_black_borders_with_coords(frame, specific_crop_box=None):
+    """
+    Crops the black borders off an HxWx3 frame, returning the cropped view and its (left, top, right, bottom) box.
+    """
     # Calculate cropping box
     if specific_crop_box:
-        crop_box = specific_crop_box
-        cropped_image = image.crop(crop_box)
-        resized_image = resize_image(cropped_image, 1280, 960)
-        return resized_image, crop_box
+        left, top, right, bottom = specific_crop_box
+        return frame[top:bottom, left:right], specific_crop_box
+
+    # Find rows and columns with any non-black channel. ORing the three channels
+    # into one plane first is much faster than reducing over the short channel axis
+    lit = frame[:, :, 0] | frame[:, :, 1]
+    lit |= frame[:, :, 2]
+    non_empty_columns = np.flatnonzero(lit.max(axis=0))
+    non_empty_rows = np.flatnonzero(lit.max(axis=1))
 
     if non_empty_rows.size and non_empty_columns.size:
         crop_box = (
-            min(non_empty_columns),
-            min(non_empty_rows),
-            max(non_empty_columns) + 1,
-            max(non_empty_rows) + 1,
+            int(non_empty_columns[0]),
+            int(non_empty_rows[0]),
+            int(non_empty_columns[-1]) + 1,
+            int(non_empty_rows[-1]) + 1,
         )
-        cropped_image = image.crop(crop_box)
-        #cropped_image = crop_to_aspect_ratio(cropped_image)
-        resized_image = resize_image(cropped_image, 1280, 960)
-        return resized_image, crop_box
+        # A slice, so the crop is a view into the capture buffer rather than a copy
+        cropped_frame = frame[crop_box[1]:crop_box[3], crop_box[0]:crop_box[2]]
+        #cropped_frame = crop_to_aspect_ratio(cropped_frame)
+        return cropped_frame, crop_box
 
-    image = resize_image(image, 1280, 960)
-    return image, (0, 0, image.width, image.height)
+    return frame, (0, 0, frame.shape[1], frame.shape[0])
 
 def overlay_rotated_needle(cockpit_img, needle_img_path, angle, position):
     """
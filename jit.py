@@ -0,0 +1,9 @@
+"""Optional Numba support. Without numba installed, njit leaves functions as plain Python."""
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
@@ -1,16 +1,32 @@
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QPainter, QPixmap, QTransform
-from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPainter, QPixmap, QPixmapCache, QRegion, QTransform
+from PyQt5.QtCore import Qt, QTimer, QPoint, QRect
 from PIL import Image
-import time
 import os
 import configparser
+import functools
 import sys
+from types import MappingProxyType
+
+def load_pixmap(path):
+    """Loads an image file as a QPixmap, sharing it with earlier loads of the same path."""
+    pixmap = QPixmapCache.find(path)
+    if pixmap is None:
+        pixmap = QPixmap(path)
+        QPixmapCache.insert(path, pixmap)
+    return pixmap
+
+# Needle rotations are cached in half-degree steps
+ANGLE_STEPS_PER_DEGREE = 2
+ROTATION_CACHE_SIZE = 720
+
+# Shortest time between repaints, however often the gauges are set (~60fps)
+MIN_REPAINT_MS = 16
 
 class Gauge:
     def __init__(self, needle_image_path, pivot, min_value, max_value, gauge_center,
                  section_one_end, section_two_start, min_angle, max_angle_section_one, max_angle_section_two):
-        self.needle_image = QPixmap(needle_image_path)
+        self.needle_image = load_pixmap(needle_image_path)
         if self.needle_image.isNull():
             print(f"Failed to load needle image from {needle_image_path}")
         self.pivot = pivot
@@ -23,20 +39,99 @@ class Gauge:
         self.max_angle_section_one = max_angle_section_one
         self.max_angle_section_two = max_angle_section_two
 
-    def rotate_needle(self, value):
-        if value <= self.section_one_end:
-            angle_range = self.max_angle_section_one - self.min_angle
-            value_range = self.section_one_end - self.min_value
-            angle = ((value - self.min_value) / value_range) * angle_range + self.min_angle
-        else:
-            angle_range = self.max_angle_section_two - self.max_angle_section_one
-            value_range = self.max_value - self.section_two_start
-            angle = ((value - self.section_two_start) / value_range) * angle_range + self.max_angle_section_one
+        # Each section maps values to angles linearly, so keep it as angle = value * slope + offset
+        self.section_one_slope = (max_angle_section_one - min_angle) / (section_one_end - min_value)
+        self.section_one_offset = min_angle - min_value * self.section_one_slope
+        self.section_two_slope = (max_angle_section_two - max_angle_section_one) / (max_value - section_two_start)
+        self.section_two_offset = max_angle_section_one - section_two_start * self.section_two_slope
+
+        self.rotations = {}
+        self.last_value = None
+        self.last_angle_key = None
+        self.last_rotation = None
 
-        transform = QTransform().translate(self.pivot[0], self.pivot[1]).rotate(-angle).translate(-self.pivot[0], -self.pivot[1])
-        return self.needle_image.transformed(transform)
+    def needle_angle(self, value):
+        if value <= self.section_one_end:
+            return value * self.section_one_slope + self.section_one_offset
+        return value * self.section_two_slope + self.section_two_offset
 
+    def angle_key(self, value):
+        """Returns the rotation step the needle is drawn at for value."""
+        return round(self.needle_angle(value) * ANGLE_STEPS_PER_DEGREE)
 
+    def rotate_needle(self, value):
+        """Returns the point to draw the needle at for value and the needle rotated for it."""
+        # Readings often repeat or stay within the same half-degree step between frames
+        if value == self.last_value:
+            return self.last_rotation
+        self.last_value = value
+        angle_key = self.angle_key(value)
+        if angle_key == self.last_angle_key:
+            return self.last_rotation
+
+        rotation = self.rotations.get(angle_key)
+        if rotation is None:
+            if angle_key == 0:
+                # Unrotated, so there's nothing to resample
+                rotated = self.needle_image
+            else:
+                angle = angle_key / ANGLE_STEPS_PER_DEGREE
+                transform = QTransform().translate(self.pivot[0], self.pivot[1]).rotate(-angle).translate(-self.pivot[0], -self.pivot[1])
+                rotated = self.needle_image.transformed(transform, Qt.FastTransformation)
+            # Integer form of int(center - size / 2) for the positive positions used here
+            rotation = (QPoint(self.gauge_center[0] - ((rotated.width() + 1) >> 1),
+                               self.gauge_center[1] - ((rotated.height() + 1) >> 1)),
+                        rotated)
+            if len(self.rotations) >= ROTATION_CACHE_SIZE:
+                del self.rotations[next(iter(self.rotations))]
+            self.rotations[angle_key] = rotation
+
+        self.last_angle_key = angle_key
+        self.last_rotation = rotation
+        return rotation
+
+
+
+def int_tuple(value):
+    """Parses a comma separated INI value into a tuple of ints."""
+    return tuple(map(int, value.split(',')))
+
+# Types of the overlay.ini values by key; anything not listed stays a string
+OVERLAY_TYPES = {
+    'high_rpm': int,
+    'high_temp': int,
+    'critical_fuel': int,
+    'low_fuel': int,
+    'rpmlight': int_tuple,
+    'fuellight': int_tuple,
+    'templight': int_tuple,
+    'lcd_gear': int_tuple,
+    'lcd_speed1': int_tuple,
+    'lcd_speed2': int_tuple,
+    'lcd_speed3': int_tuple,
+    'pivot': int_tuple,
+    'min_value': int,
+    'max_value': int,
+    'gauge_center': int_tuple,
+    'section_one_end': int,
+    'section_two_start': int,
+    'min_angle': float,
+    'max_angle_section_one': float,
+    'max_angle_section_two': float,
+    'front_rollbar': int_tuple,
+    'rear_rollbar': int_tuple,
+    'shifter': int_tuple,
+}
+
+@functools.lru_cache(maxsize=8)
+def load_overlay_config(config_path, mtime):
+    """Parses overlay.ini into read-only per-section dicts of typed values, once per modification time."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return MappingProxyType({
+        section: MappingProxyType({key: OVERLAY_TYPES.get(key, str)(value) for key, value in config.items(section)})
+        for section in config.sections()
+    })
 
 class CockpitOverlay(QWidget):
     def __init__(self):
@@ -52,10 +147,9 @@ class CockpitOverlay(QWidget):
             print("Configuration file not found!")
             sys.exit(1)
 
-        config = configparser.ConfigParser()
-        config.read(config_path)
+        config = load_overlay_config(config_path, os.path.getmtime(config_path))
 
-        self.image = QPixmap(config.get('General', 'cockpit_path'))
+        self.image = load_pixmap(config['General']['cockpit_path'])
 
         self.tachometer_gauge = self.create_gauge(config, "Tachometer")
         self.boost_gauge = self.create_gauge(config, "Boost")
@@ -69,80 +163,116 @@ class CockpitOverlay(QWidget):
         self.temp = 0
         self.fuel = 0
         self.mph = 0
-        self.rpm_threshold = int(config.get('General', 'high_rpm'))
-        self.high_temp = int(config.get('General', 'high_temp'))
-        self.critical_fuel = int(config.get('General', 'critical_fuel'))
-        self.low_fuel = int(config.get('General', 'low_fuel'))
+        self.rpm_threshold = config['General']['high_rpm']
+        self.high_temp = config['General']['high_temp']
+        self.critical_fuel = config['General']['critical_fuel']
+        self.low_fuel = config['General']['low_fuel']
         self.fuel_blinker = False
-        self.blink_timer = 0
+        self.blink_timer = QTimer(self)
+        self.blink_timer.timeout.connect(self.toggle_fuel_blinker)
         self.blink_duration = 0.5
-        self.last_blink_time = 0
+        self.critical_blink_duration = 0.25
         self.boost_setting = 1
 
-        self.fuel_x, self.fuel_y = tuple(map(int, config.get('General', 'fuellight').split(',')))
-        self.temp_x, self.temp_y = tuple(map(int, config.get('General', 'templight').split(',')))
-        self.rpm_x, self.rpm_y = tuple(map(int, config.get('General', 'rpmlight').split(',')))
+        self.fuel_x, self.fuel_y = config['General']['fuellight']
+        self.temp_x, self.temp_y = config['General']['templight']
+        self.rpm_x, self.rpm_y = config['General']['rpmlight']
 
 
         self.temp_blinker = False
-        self.temp_blink_timer = 0
+        self.temp_blink_timer = QTimer(self)
+        self.temp_blink_timer.timeout.connect(self.toggle_temp_blinker)
         self.temp_blink_duration = 0.5
-        self.temp_last_blink_time = 0
 
-        image_pixmap = QPixmap(config.get('LCD display', 'lcdnums_path'))
-        self.lcd_speed1_x, self.lcd_speed1_y = tuple(map(int, config.get('LCD display', 'lcd_speed1').split(',')))
-        self.lcd_speed2_x, self.lcd_speed2_y = tuple(map(int, config.get('LCD display', 'lcd_speed2').split(',')))
-        self.lcd_speed3_x, self.lcd_speed3_y = tuple(map(int, config.get('LCD display', 'lcd_speed3').split(',')))
-        self.lcd_gear_x, self.lcd_gear_y = tuple(map(int, config.get('LCD display', 'lcd_gear').split(',')))
+        # The LCD digits stay in one atlas pixmap and are drawn from their source rects
+        self.lcd_digits = load_pixmap(config['LCD display']['lcdnums_path'])
+        self.lcd_speed1_x, self.lcd_speed1_y = config['LCD display']['lcd_speed1']
+        self.lcd_speed2_x, self.lcd_speed2_y = config['LCD display']['lcd_speed2']
+        self.lcd_speed3_x, self.lcd_speed3_y = config['LCD display']['lcd_speed3']
+        self.lcd_gear_x, self.lcd_gear_y = config['LCD display']['lcd_gear']
         
-        digit_width = image_pixmap.width() // 10
-        digit_height = image_pixmap.height()
-
-        self.digit_images = []
-        for i in range(10):
-            x = i * digit_width
-            y = 0
-            digit_pixmap = image_pixmap.copy(x, y, digit_width, digit_height)
-            self.digit_images.append(digit_pixmap)
-
-        self.rollbar_images = [
-            QPixmap(config.get('Rollbars', 'rollbar1')),
-            QPixmap(config.get('Rollbars', 'rollbar2')),
-            QPixmap(config.get('Rollbars', 'rollbar3')),
-            QPixmap(config.get('Rollbars', 'rollbar4')),
-            QPixmap(config.get('Rollbars', 'rollbar5')),
-            QPixmap(config.get('Rollbars', 'rollbar6')),
-            QPixmap(config.get('Rollbars', 'rollbar7')),
-            QPixmap(config.get('Rollbars', 'rollbar8'))
-        ]
-
-        self.fbar_x, self.fbar_y = tuple(map(int, config.get('Rollbars', 'front_rollbar').split(',')))
-        self.rbar_x, self.rbar_y = tuple(map(int, config.get('Rollbars', 'rear_rollbar').split(',')))
-        self.shifter_x, self.shifter_y = tuple(map(int, config.get('Shifter', 'shifter').split(',')))
-
-        self.gear_images = [
-            QPixmap(config.get('Shifter', 'gear1')),
-            QPixmap(config.get('Shifter', 'gear2')),
-            QPixmap(config.get('Shifter', 'gear3')),
-            QPixmap(config.get('Shifter', 'gear4')),
-            QPixmap(config.get('Shifter', 'gear5')),
-            QPixmap(config.get('Shifter', 'gear6')),
-        ]
-
-        self.rpmlight = QPixmap(config.get('General', 'rpmlight_path'))
-        self.fuellight = QPixmap(config.get('General', 'fuellight_path'))
+        digit_width = self.lcd_digits.width() // 10
+        digit_height = self.lcd_digits.height()
+
+        self.digit_rects = tuple(QRect(i * digit_width, 0, digit_width, digit_height) for i in range(10))
+        self.lcd_gear_position = QPoint(self.lcd_gear_x, self.lcd_gear_y)
+        self.rpm_position = QPoint(self.rpm_x, self.rpm_y)
+        self.fuel_position = QPoint(self.fuel_x, self.fuel_y)
+        self.temp_position = QPoint(self.temp_x, self.temp_y)
+
+        # The three speed digits are drawn as one pixmap covering all of their positions
+        self.speed_readout_rect = QRect()
+        for x, y in ((self.lcd_speed1_x, self.lcd_speed1_y), (self.lcd_speed2_x, self.lcd_speed2_y), (self.lcd_speed3_x, self.lcd_speed3_y)):
+            self.speed_readout_rect |= QRect(x, y, digit_width, digit_height)
+        self.speed_readouts = {}
+
+        self.rollbar_images = (
+            load_pixmap(config['Rollbars']['rollbar1']),
+            load_pixmap(config['Rollbars']['rollbar2']),
+            load_pixmap(config['Rollbars']['rollbar3']),
+            load_pixmap(config['Rollbars']['rollbar4']),
+            load_pixmap(config['Rollbars']['rollbar5']),
+            load_pixmap(config['Rollbars']['rollbar6']),
+            load_pixmap(config['Rollbars']['rollbar7']),
+            load_pixmap(config['Rollbars']['rollbar8']),
+        )
+
+        self.fbar_x, self.fbar_y = config['Rollbars']['front_rollbar']
+        self.rbar_x, self.rbar_y = config['Rollbars']['rear_rollbar']
+        self.shifter_x, self.shifter_y = config['Shifter']['shifter']
+        self.fbar_position = QPoint(self.fbar_x, self.fbar_y)
+        self.rbar_position = QPoint(self.rbar_x, self.rbar_y)
+        self.shifter_position = QPoint(self.shifter_x, self.shifter_y)
+
+        self.gear_images = (
+            load_pixmap(config['Shifter']['gear1']),
+            load_pixmap(config['Shifter']['gear2']),
+            load_pixmap(config['Shifter']['gear3']),
+            load_pixmap(config['Shifter']['gear4']),
+            load_pixmap(config['Shifter']['gear5']),
+            load_pixmap(config['Shifter']['gear6']),
+        )
+
+        self.rpmlight = load_pixmap(config['General']['rpmlight_path'])
+        self.fuellight = load_pixmap(config['General']['fuellight_path'])
+
+        # The composited frame, redrawn only when the gauges change or a light blinks
+        self.gauge_state = None
+        self.frame_dirty = True
+        self.repaint_pending = False
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.setInterval(MIN_REPAINT_MS)
+        self.repaint_timer.timeout.connect(self.repaint_if_pending)
+
+        # The cockpit image at the widget's size and the frame it's composited
+        # into, both rebuilt on resize and then reused for every frame
+        self.scaled_image = self.image
+        self.frame_pixmap = self.image.copy()
+        self.image_scale_x = 1.0
+        self.image_scale_y = 1.0
+        self.frame_transform = QTransform()
+
+        # The cockpit with the LCD gear, rollbars and shifter already drawn on it,
+        # rebuilt only when one of those changes
+        self.static_hud = self.scaled_image
+        self.static_hud_draws = None
+
+        # What the last frame drew, to repaint only the parts that changed
+        self.last_draws = {}
 
     def create_gauge(self, config, section):
-        needle_image_path = config.get(section, 'needle_image_path')
-        pivot = tuple(map(int, config.get(section, 'pivot').split(',')))
-        min_value = config.getint(section, 'min_value')
-        max_value = config.getint(section, 'max_value')
-        gauge_center = tuple(map(int, config.get(section, 'gauge_center').split(',')))
-        section_one_end = config.getint(section, 'section_one_end')
-        section_two_start = config.getint(section, 'section_two_start')
-        min_angle = config.getfloat(section, 'min_angle')
-        max_angle_section_one = config.getfloat(section, 'max_angle_section_one')
-        max_angle_section_two = config.getfloat(section, 'max_angle_section_two')
+        gauge_config = config[section]
+        needle_image_path = gauge_config['needle_image_path']
+        pivot = gauge_config['pivot']
+        min_value = gauge_config['min_value']
+        max_value = gauge_config['max_value']
+        gauge_center = gauge_config['gauge_center']
+        section_one_end = gauge_config['section_one_end']
+        section_two_start = gauge_config['section_two_start']
+        min_angle = gauge_config['min_angle']
+        max_angle_section_one = gauge_config['max_angle_section_one']
+        max_angle_section_two = gauge_config['max_angle_section_two']
 
         return Gauge(
             needle_image_path=needle_image_path,
@@ -158,7 +288,14 @@ class CockpitOverlay(QWidget):
         ) 
 
     def setPositionAndSize(self, x, y, width, height):
-        self.setGeometry(x, y, width, height)
+        # Called every frame, so only move the window when it's actually out of place
+        if self.geometry().getRect() != (x, y, width, height):
+            self.setGeometry(x, y, width, height)
+
+    def setOverlayVisible(self, visible):
+        """Shows or hides the overlay, skipping the call when it's already in that state."""
+        if self.isVisible() != visible:
+            self.setVisible(visible)
 
     def setGauges(self, rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_setting):
         self.rpm = rpm
@@ -171,95 +308,193 @@ class CockpitOverlay(QWidget):
         self.r_rollbar = r_rollbar
         self.brake = brake
         self.boost_setting = boost_setting
-        self.update()
-
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-
-        combined_image = self.image.copy()
-
-
-        rotated_tachneedle = self.tachometer_gauge.rotate_needle(self.rpm)
-        rotated_boostneedle = self.boost_gauge.rotate_needle(self.boost)
-        rotated_tempneedle = self.temp_gauge.rotate_needle(self.temp)
-        rotated_fuelneedle = self.fuel_gauge.rotate_needle(self.fuel)
-        rotated_brakebias = self.brakebias_knob.rotate_needle(self.brake)
-        rotated_boostknob = self.boost_knob.rotate_needle(self.boost_setting)
-
-        tach_needle_x = int(self.tachometer_gauge.gauge_center[0] - rotated_tachneedle.width() / 2)
-        tach_needle_y = int(self.tachometer_gauge.gauge_center[1] - rotated_tachneedle.height() / 2)
-        boost_needle_x = int(self.boost_gauge.gauge_center[0] - rotated_boostneedle.width() / 2)
-        boost_needle_y = int(self.boost_gauge.gauge_center[1] - rotated_boostneedle.height() / 2)
-        temp_needle_x = int(self.temp_gauge.gauge_center[0] - rotated_tempneedle.width() / 2)
-        temp_needle_y = int(self.temp_gauge.gauge_center[1] - rotated_tempneedle.height() / 2)
-        fuel_needle_x = int(self.fuel_gauge.gauge_center[0] - rotated_fuelneedle.width() / 2)
-        fuel_needle_y = int(self.fuel_gauge.gauge_center[1] - rotated_fuelneedle.height() / 2)
-        brakebias_x = int(self.brakebias_knob.gauge_center[0] - rotated_brakebias.width() / 2)
-        brakebias_y = int(self.brakebias_knob.gauge_center[1] - rotated_brakebias.height() / 2)
-        boostknob_x = int(self.boost_knob.gauge_center[0] - rotated_boostknob.width() / 2)
-        boostknob_y = int(self.boost_knob.gauge_center[1] - rotated_boostknob.height() / 2)
-
-        temp_painter = QPainter(combined_image)
-        temp_painter.drawPixmap(tach_needle_x, tach_needle_y, rotated_tachneedle)
-        temp_painter.drawPixmap(boost_needle_x, boost_needle_y, rotated_boostneedle)
-        temp_painter.drawPixmap(temp_needle_x, temp_needle_y, rotated_tempneedle)
-        temp_painter.drawPixmap(fuel_needle_x, fuel_needle_y, rotated_fuelneedle)
-        temp_painter.drawPixmap(brakebias_x, brakebias_y, rotated_brakebias)
-        temp_painter.drawPixmap(boostknob_x, boostknob_y, rotated_boostknob)
 
-        if self.rpm > self.rpm_threshold:
-            temp_painter.drawPixmap(self.rpm_x, self.rpm_y, self.rpmlight)
-
-        digit_1 = self.mph // 100
-        digit_2 = (self.mph % 100) // 10
-        digit_3 = self.mph % 10
-
-        if digit_1 == 0 and digit_2 != 0:
-            temp_painter.drawPixmap(self.lcd_speed2_x, self.lcd_speed2_y, self.digit_images[digit_2])
-            temp_painter.drawPixmap(self.lcd_speed3_x, self.lcd_speed3_y,  self.digit_images[digit_3])
-        elif digit_1 == 0 and digit_2 == 0:
-            temp_painter.drawPixmap(self.lcd_speed3_x, self.lcd_speed3_y, self.digit_images[digit_3])
+        # The lights blink on their own timers, which repaint the overlay as they toggle
+        if fuel < self.low_fuel:
+            self.start_blinking(self.blink_timer, self.critical_blink_duration if fuel < self.critical_fuel else self.blink_duration)
         else:
-            temp_painter.drawPixmap(self.lcd_speed1_x, self.lcd_speed1_y, self.digit_images[digit_1])
-            temp_painter.drawPixmap(self.lcd_speed2_x, self.lcd_speed2_y, self.digit_images[digit_2])
-            temp_painter.drawPixmap(self.lcd_speed3_x, self.lcd_speed3_y, self.digit_images[digit_3])
-
-        temp_painter.drawPixmap(self.lcd_gear_x, self.lcd_gear_y, self.digit_images[self.gear])
-        temp_painter.drawPixmap(self.fbar_x, self.fbar_y, self.rollbar_images[self.f_rollbar])
-        temp_painter.drawPixmap(self.rbar_x, self.rbar_y, self.rollbar_images[self.r_rollbar])
-        temp_painter.drawPixmap(self.shifter_x, self.shifter_y, self.gear_images[self.gear - 1])
-
-        if self.fuel < self.critical_fuel:
-            self.blink_duration = 0.25
+            self.blink_timer.stop()
+            self.fuel_blinker = False
+        if temp >= self.high_temp:
+            self.start_blinking(self.temp_blink_timer, self.temp_blink_duration)
         else:
-            self.blink_duration = 0.5
+            self.temp_blink_timer.stop()
+            self.temp_blinker = False
 
-        if self.fuel < self.low_fuel:
-            current_time = time.time()
-            if current_time - self.last_blink_time > self.blink_duration:
-                self.last_blink_time = current_time
-                self.fuel_blinker = not self.fuel_blinker
+        # Compare needles by the half-degree step they're drawn at, so readings
+        # that wobble within a step don't recomposite an identical frame
+        state = (self.tachometer_gauge.angle_key(rpm), rpm > self.rpm_threshold,
+                 self.boost_gauge.angle_key(boost), self.temp_gauge.angle_key(temp),
+                 self.fuel_gauge.angle_key(fuel), self.brakebias_knob.angle_key(brake),
+                 self.boost_knob.angle_key(boost_setting), mph, gear, f_rollbar, r_rollbar)
+        if state != self.gauge_state:
+            self.gauge_state = state
+            self.frame_dirty = True
+            self.schedule_repaint()
+
+    def speed_readout(self, mph):
+        """Returns the LCD speed composited into one pixmap, built once per speed."""
+        readout = self.speed_readouts.get(mph)
+        if readout is None:
+            digit_1 = mph // 100
+            digit_2 = (mph % 100) // 10
+            digit_3 = mph % 10
+
+            readout = QPixmap(self.speed_readout_rect.size())
+            readout.fill(Qt.transparent)
+            painter = QPainter(readout)
+            painter.translate(-self.speed_readout_rect.topLeft())
+            # Leading zeros are left blank
+            if digit_1 != 0:
+                painter.drawPixmap(self.lcd_speed1_x, self.lcd_speed1_y, self.lcd_digits, *self.digit_rects[digit_1].getRect())
+            if digit_1 != 0 or digit_2 != 0:
+                painter.drawPixmap(self.lcd_speed2_x, self.lcd_speed2_y, self.lcd_digits, *self.digit_rects[digit_2].getRect())
+            painter.drawPixmap(self.lcd_speed3_x, self.lcd_speed3_y, self.lcd_digits, *self.digit_rects[digit_3].getRect())
+            painter.end()
+            self.speed_readouts[mph] = readout
+        return readout
+
+    def schedule_repaint(self):
+        """Repaints now, or when MIN_REPAINT_MS has passed since the last repaint."""
+        if self.repaint_timer.isActive():
+            self.repaint_pending = True
         else:
-            self.fuel_blinker = False
+            self.refresh()
+            self.repaint_timer.start()
+
+    def repaint_if_pending(self):
+        if self.repaint_pending:
+            self.repaint_pending = False
+            self.refresh()
+            self.repaint_timer.start()
+
+    def refresh(self):
+        """Recomposites the frame if it's dirty and repaints just the area that changed."""
+        if self.frame_dirty:
+            self.frame_dirty = False
+            changed = self.render_frame()
+            if not changed.isEmpty():
+                self.update(changed)
+
+    def start_blinking(self, timer, duration):
+        """Runs a blink timer every duration seconds, leaving it alone if it already is."""
+        interval = int(duration * 1000)
+        if not timer.isActive() or timer.interval() != interval:
+            timer.start(interval)
+
+    def toggle_fuel_blinker(self):
+        self.fuel_blinker = not self.fuel_blinker
+        self.frame_dirty = True
+        self.schedule_repaint()
+
+    def toggle_temp_blinker(self):
+        self.temp_blinker = not self.temp_blinker
+        self.frame_dirty = True
+        self.schedule_repaint()
+
+    def resizeEvent(self, event):
+        # Scale the cockpit once here; the gauges are then drawn straight onto it at this size
+        self.scaled_image = self.image.scaled(self.width(), self.height(), Qt.KeepAspectRatio)
+        self.image_scale_x = self.scaled_image.width() / self.image.width()
+        self.image_scale_y = self.scaled_image.height() / self.image.height()
+        self.frame_transform = QTransform.fromScale(self.image_scale_x, self.image_scale_y)
+        self.frame_pixmap = self.scaled_image.copy()
+        self.static_hud_draws = None
+        self.frame_dirty = True
+        self.last_draws = {}
+        super().resizeEvent(event)
 
-        if self.fuel_blinker:
-            temp_painter.drawPixmap(self.fuel_x, self.fuel_y, self.fuellight)
+    def paintEvent(self, event):
+        if self.frame_dirty:
+            self.frame_dirty = False
+            # The new frame can differ outside this event's rect too, so queue a repaint for the rest
+            changed = QRegion(self.render_frame()).subtracted(event.region())
+            if not changed.isEmpty():
+                self.update(changed)
+
+        # Moves and partial exposes reuse the composited frame, copying only the exposed part
+        exposed = event.rect().intersected(self.frame_pixmap.rect())
+        painter = QPainter(self)
+        painter.drawPixmap(exposed, self.frame_pixmap, exposed)
+        painter.end()
 
-        if self.temp >= self.high_temp:
-            current_time = time.time()
-            if current_time - self.temp_last_blink_time > self.temp_blink_duration:
-                self.temp_last_blink_time = current_time
-                self.temp_blinker = not self.temp_blinker
-        else:
-            self.temp_blinker = False
+    def gauge_draws(self):
+        """Returns this frame's draws over the static layer, in order, as {part: (position, pixmap, source rect)}."""
+        draws = {}
+        for part, gauge, value in (('tachometer', self.tachometer_gauge, self.rpm),
+                                   ('boost', self.boost_gauge, self.boost),
+                                   ('temperature', self.temp_gauge, self.temp),
+                                   ('fuel', self.fuel_gauge, self.fuel),
+                                   ('brake bias', self.brakebias_knob, self.brake),
+                                   ('boost knob', self.boost_knob, self.boost_setting)):
+            position, rotated = gauge.rotate_needle(value)
+            draws[part] = (position, rotated, rotated.rect())
 
-        if self.temp_blinker:
-            temp_painter.drawPixmap(self.temp_x, self.temp_y, self.fuellight)
+        if self.rpm > self.rpm_threshold:
+            draws['rpm light'] = (self.rpm_position, self.rpmlight, self.rpmlight.rect())
 
-        temp_painter.end()
+        speed_readout = self.speed_readout(self.mph)
+        draws['speed'] = (self.speed_readout_rect.topLeft(), speed_readout, speed_readout.rect())
 
-        scaled_image = combined_image.scaled(self.width(), self.height(), Qt.KeepAspectRatio)
-        painter.drawPixmap(0, 0, scaled_image)
+        if self.fuel_blinker:
+            draws['fuel light'] = (self.fuel_position, self.fuellight, self.fuellight.rect())
 
+        if self.temp_blinker:
+            draws['temp light'] = (self.temp_position, self.fuellight, self.fuellight.rect())
+
+        return draws
+
+    def static_draws(self):
+        """Returns the draws that only change with the gear or rollbar settings, in the same form as gauge_draws."""
+        draws = {}
+        draws['gear digit'] = (self.lcd_gear_position, self.lcd_digits, self.digit_rects[self.gear])
+        front_rollbar = self.rollbar_images[self.f_rollbar]
+        draws['front rollbar'] = (self.fbar_position, front_rollbar, front_rollbar.rect())
+        rear_rollbar = self.rollbar_images[self.r_rollbar]
+        draws['rear rollbar'] = (self.rbar_position, rear_rollbar, rear_rollbar.rect())
+        shifter = self.gear_images[self.gear - 1]
+        draws['shifter'] = (self.shifter_position, shifter, shifter.rect())
+        return draws
+
+    def render_static_hud(self, draws):
+        """Bakes the static draws into a copy of the scaled cockpit."""
+        self.static_hud = self.scaled_image.copy()
+        painter = QPainter(self.static_hud)
+        painter.setTransform(self.frame_transform)
+        for position, pixmap, source_rect in draws.values():
+            painter.drawPixmap(position, pixmap, source_rect)
         painter.end()
+        self.static_hud_draws = draws
+
+    def render_frame(self):
+        """Composites the frame and returns the widget area that differs from the last one."""
+        static_draws = self.static_draws()
+        if static_draws != self.static_hud_draws:
+            self.render_static_hud(static_draws)
+        draws = self.gauge_draws()
+
+        temp_painter = QPainter(self.frame_pixmap)
+        # Overwrite last frame's pixels, transparent ones included, with the static layer
+        temp_painter.setCompositionMode(QPainter.CompositionMode_Source)
+        temp_painter.drawPixmap(0, 0, self.static_hud)
+        temp_painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        temp_painter.setTransform(self.frame_transform)
+        for position, pixmap, source_rect in draws.values():
+            temp_painter.drawPixmap(position, pixmap, source_rect)
+        temp_painter.end()
+        draws.update(static_draws)
+
+        # Both where a changed part was and where it is now need repainting
+        changed = QRect()
+        for part in self.last_draws.keys() | draws.keys():
+            last_draw = self.last_draws.get(part)
+            draw = draws.get(part)
+            if draw != last_draw:
+                for position, _, source_rect in filter(None, (last_draw, draw)):
+                    changed |= QRect(position, source_rect.size())
+        self.last_draws = draws
+
+        if changed.isNull():
+            return changed
+        # Pad by a pixel for rounding in the scaled draws
+        return self.frame_transform.mapRect(changed).adjusted(-1, -1, 1, 1)
@@ -1,39 +1,93 @@
 import win32gui
+import win32con
+import numpy as np
+from PIL import Image
+import time
+from collections import deque, namedtuple
 #from datetime import datetime
-from window_capture import find_dosbox_window, capture_window, get_title_bar_height
-from image_processing import crop_black_borders_with_coords, is_in_cockpit_view
-from dashboard_reader import read_dashboard, plot_lcd_locations
+from window_capture import find_dosbox_window, get_window_info, get_client_area, create_capture, exclude_from_capture, DesktopDuplicationCapture
+from image_processing import crop_black_borders_with_coords, build_cockpit_probes, is_in_cockpit_view, resize_image, REFERENCE_WIDTH, REFERENCE_HEIGHT
+from dashboard_reader import read_dashboard, plot_lcd_locations, get_config
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
 from overlay import CockpitOverlay  # Import the CockpitOverlay class
 import threading
-from gear_handler import GearHandler
+import logging
 import keyboard
 
-class OverlayHandler:
-    def __init__(self, game_state, cockpit_pixels, config):
+logger = logging.getLogger(__name__)
+
+# Poll rate while the overlay is hidden (menus, other views, DOSBox in the background)
+IDLE_LOOP_MS = 33
+
+# How long a hotkey waits for the capture thread to hand over a frame
+SNAPSHOT_TIMEOUT_SECONDS = 1.0
+
+# How often the DOSBox window is looked up again by enumerating all windows
+WINDOW_RECHECK_SECONDS = 1.0
+
+# The capture thread's view of one frame. hwnd is None when DOSBox isn't
+# running; the rest is only filled in while DOSBox is in the foreground.
+FrameState = namedtuple('FrameState', 'hwnd foreground window_x window_y coords in_cockpit reading')
+
+class OverlayHandler(QObject):
+    # Emitted by the capture thread after each frame, queued to the Qt thread
+    frame_ready = pyqtSignal()
+
+    def __init__(self, game_state, cockpit_pixels, settings):
+        super().__init__()
         self.gs = game_state
-        self.cockpit_pixels = cockpit_pixels
-        self.config = config
+        self.cockpit_probes = build_cockpit_probes(cockpit_pixels)
+        self.settings = settings
 
-        self.last_screenshot = None
+        # Hotkeys ask the capture thread for a copy of its next frame rather
+        # than reading the capture buffers while they're being written
+        self.snapshot = None
+        self.snapshot_requested = threading.Event()
+        self.snapshot_ready = threading.Event()
+        # Two capture buffers, alternated so the previous frame is still intact to compare against
+        self.capture_buffers = [None, None]
+        self.last_frame_cropbox = None
+        self.frame_coords = None
+        self.frame_in_cockpit = False
+        self.frame_reading = None
         self.dosbox_window_opened = False
-        self.x_adjustment = config.getint('Overlay positioning', 'x_adjustment')
-        self.y_adjustment = config.getint('Overlay positioning', 'y_adjustment')
-        self.boost_drop_rate_per_second = config.getfloat('Boost rise and fall speed', 'boost_drop_rate_per_second')
-        self.boost_climb_rate_per_second = config.getfloat('Boost rise and fall speed', 'boost_climb_rate_per_second')
+        self.dosbox_hwnd = None
+        self.dosbox_hwnd_checked = None
+        self.x_adjustment = settings['Overlay positioning']['x_adjustment']
+        self.y_adjustment = settings['Overlay positioning']['y_adjustment']
+        self.boost_drop_rate_per_second = settings['Boost rise and fall speed']['boost_drop_rate_per_second']
+        self.boost_climb_rate_per_second = settings['Boost rise and fall speed']['boost_climb_rate_per_second']
         self.cockpit_on = True
         self.overlay_locked = False
         self.cropbox = None
-        self.hshifter_on = config.get('Gear shifting', 'hshifter').lower() == 'on'
-        
+        self.hshifter_on = settings['Gear shifting']['hshifter']
+        self.capture_window = create_capture(settings['General'].get('capture_method', 'gdi'))
+        self.loop_seconds = settings['General']['loop_ms'] / 1000
+        self.idle_loop_seconds = max(self.loop_seconds, IDLE_LOOP_MS / 1000)
+
+        # Capture and dashboard reading run on their own thread, which leaves
+        # only the newest FrameState here and signals the Qt thread to pick it up
+        self.frame_states = deque(maxlen=1)
+        self.capture_stop_event = threading.Event()
+        self.capture_thread = None
+
+        # Load the dashboard reader config up front so a missing INI fails at startup
+        get_config()
+
         # Initialize the game state object
-        self.gs.boost_drop_rate_per_second = self.boost_drop_rate_per_second
-        self.gs.boost_climb_rate_per_second = self.boost_climb_rate_per_second
+        self.gs.set_boost_rates(self.boost_drop_rate_per_second, self.boost_climb_rate_per_second)
 
-        # Initialize the gear handler
-        self.gear_handler = GearHandler(self.gs, config, self)
+        # Initialize the gear handler. Without the H-shifter it would only poll
+        # keys and hold the mixer open, so it isn't created, and pygame isn't even imported.
+        self.gear_handler = None
+        if self.hshifter_on:
+            from gear_handler import GearHandler
+            self.gear_handler = GearHandler(self.gs, settings, self)
         self.stop_event = threading.Event()
-        self.gear_listener_thread = threading.Thread(target=self.gear_handler.gear_change_listener, args=(self.gs, self.stop_event), daemon=True)
+        self.gear_listener_thread = None
+        # Whether the listener was last resumed, so per-frame calls only act on a change
+        self.gear_listening = False
 
         # Set up the keyboard hotkey
         keyboard.add_hotkey('ctrl+s', self.take_screenshot)
@@ -45,22 +99,46 @@ class OverlayHandler:
             self.cropbox = None
             print ('Overlay position unlocked')
         else:
+            screenshot = self.request_snapshot()
+            if screenshot is None:
+                return
             self.overlay_locked = True
-            _, self.cropbox = crop_black_borders_with_coords(self.last_screenshot, None)
+            _, self.cropbox = crop_black_borders_with_coords(screenshot, None)
             print (f'Overlay position locked with cropping box at {self.cropbox}')
 
+    def request_snapshot(self):
+        """Returns a copy of the capture thread's next DOSBox frame, or None if none arrives in time."""
+        self.snapshot_ready.clear()
+        self.snapshot_requested.set()
+        if not self.snapshot_ready.wait(SNAPSHOT_TIMEOUT_SECONDS):
+            self.snapshot_requested.clear()
+            return None
+        return self.snapshot
+
     def start_gear_listener(self):
-        """Start the gear listener thread if it's not already running."""
+        """Resume the gear listener, starting its thread the first time."""
+        if self.gear_handler is None or self.gear_listening:
+            return
         if self.gear_listener_thread is None or not self.gear_listener_thread.is_alive():
             self.stop_event.clear()
             self.gear_listener_thread = threading.Thread(target=self.gear_handler.gear_change_listener, args=(self.gs, self.stop_event), daemon=True)
             self.gear_listener_thread.start()
             #print (f'Starting gear listener thread')
+        self.gear_handler.set_listening(True)
+        self.gear_listening = True
 
     def stop_gear_listener(self):
+        """Pause the gear listener; its thread waits until it's resumed."""
+        if self.gear_listening:
+            self.gear_handler.set_listening(False)
+            self.gear_listening = False
+
+    def close_gear_listener(self):
         """Stop the gear listener thread if it's running."""
         if self.gear_listener_thread is not None and self.gear_listener_thread.is_alive():
             self.stop_event.set()
+            self.gear_handler.set_listening(False)
+            self.gear_listening = False
             self.gear_listener_thread.join()
             self.gear_listener_thread = None
             #print (f'Stopping gear listener thread')
@@ -69,70 +147,150 @@ class OverlayHandler:
         """Set up the overlay interface."""
         self.app = app
         self.cockpit_overlay = CockpitOverlay()  # Initialize the CockpitOverlay
-    
+        if isinstance(self.capture_window, DesktopDuplicationCapture):
+            # Screen capture would otherwise see the overlay drawn over DOSBox
+            exclude_from_capture(self.cockpit_overlay)
+        # If the Qt thread falls behind, the extra signals find no new frame and return
+        self.frame_ready.connect(self.update_loop, Qt.QueuedConnection)
+        self.start_capture()
+
+    def start_capture(self):
+        """Start the capture thread."""
+        self.capture_stop_event.clear()
+        self.capture_thread = threading.Thread(target=self.capture_loop, args=(self.capture_stop_event,), daemon=True)
+        self.capture_thread.start()
+
+    def stop_capture(self):
+        """Stop the capture thread if it's running."""
+        if self.capture_thread is not None and self.capture_thread.is_alive():
+            self.capture_stop_event.set()
+            self.capture_thread.join()
+            self.capture_thread = None
+            self.capture_window.close()
+
+    def capture_loop(self, stop_event):
+        """Captures and reads DOSBox frames until stop_event is set, keeping only the newest."""
+        next_frame = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                state = self.read_frame()
+            except Exception:
+                # e.g. DOSBox closing between the window check and the blit. Report it and
+                # hide the overlay; the next frame finds the window again or notices it's gone
+                logger.exception("Failed to capture the DOSBox window")
+                state = FrameState(self.dosbox_hwnd, False, 0, 0, None, False, None)
+            self.frame_states.append(state)
+            self.frame_ready.emit()
+
+            # Full rate while the gauges are up
+            now = time.perf_counter()
+            interval = self.loop_seconds if state.in_cockpit else self.idle_loop_seconds
+            next_frame = max(next_frame + interval, now)
+            stop_event.wait(next_frame - now)
+
+    def find_dosbox(self):
+        """Returns the DOSBox window, only enumerating windows again once the cached one is stale or closed."""
+        now = time.perf_counter()
+        hwnd = self.dosbox_hwnd
+        if self.dosbox_hwnd_checked is None or now - self.dosbox_hwnd_checked >= WINDOW_RECHECK_SECONDS or (hwnd and not win32gui.IsWindow(hwnd)):
+            hwnd = find_dosbox_window()
+            self.dosbox_hwnd = hwnd
+            self.dosbox_hwnd_checked = now
+        return hwnd
+
+    def read_frame(self):
+        """Captures the DOSBox window and reads the dashboard, returning a FrameState."""
+        hwnd = self.find_dosbox()
+        if not hwnd:
+            return FrameState(None, False, 0, 0, None, False, None)
+        # One GetWindowInfo call covers the window check, visibility and both rects
+        info = get_window_info(hwnd)
+        if info is None or not info.dwStyle & win32con.WS_VISIBLE or hwnd != win32gui.GetForegroundWindow():
+            return FrameState(hwnd, False, 0, 0, None, False, None)
+
+        self.capture_buffers.reverse()
+        screenshot = self.capture_window(hwnd, info, self.capture_buffers[0])
+        self.capture_buffers[0] = screenshot.base
+        if self.snapshot_requested.is_set():
+            self.snapshot = screenshot.copy()
+            self.snapshot_requested.clear()
+            self.snapshot_ready.set()
+
+        # A frame identical to the last one (e.g. ICR2 paused) crops and reads
+        # the same, so only redo that work when the pixels or crop box change
+        cropbox = self.cropbox
+        if not np.array_equal(*self.capture_buffers) or cropbox != self.last_frame_cropbox:
+            self.last_frame_cropbox = cropbox
+
+            # The crop is a view, so the cockpit check and the dashboard read sample the capture buffer directly
+            frame, self.frame_coords = crop_black_borders_with_coords(screenshot, cropbox)
+            self.frame_in_cockpit = is_in_cockpit_view(frame, self.cockpit_probes)
+            self.frame_reading = read_dashboard(frame) if self.frame_in_cockpit else None
+
+        _, title_bar_height, _, _ = get_client_area(info)
+        return FrameState(hwnd, True, info.rcWindow.left, info.rcWindow.top + title_bar_height, self.frame_coords, self.frame_in_cockpit, self.frame_reading)
+
     def update_loop(self):
-        """Main loop for updating the overlay and handling user inputs."""
-        hwnd = find_dosbox_window()
-    
+        """Main loop for updating the overlay from the capture thread's newest frame."""
+        try:
+            state = self.frame_states.popleft()
+        except IndexError:
+            return  # Already handled by an earlier signal
+
         # Ensure DOSBox window is present and handle overlay accordingly
-        if hwnd:
+        if state.hwnd:
             if not self.dosbox_window_opened:
                 self.dosbox_window_opened = True
                 print('ICR2 DOSBox window detected')
-            self.handle_dosbox_overlay(hwnd)
+            self.handle_dosbox_overlay(state)
         else:
             if self.dosbox_window_opened:
                 print('Script ending')
-                self.cockpit_overlay.hide()  # Hide overlay if DOSBox window is missing
+                self.cockpit_overlay.setOverlayVisible(False)  # Hide overlay if DOSBox window is missing
+                self.stop_capture()
+                self.close_gear_listener()
                 self.app.quit()  # Quit the application
-            self.cockpit_overlay.hide()  # Hide overlay if DOSBox window is missing
+            self.cockpit_overlay.setOverlayVisible(False)  # Hide overlay if DOSBox window is missing
             self.stop_gear_listener()  # Stop the gear listener thread
 
-    def handle_dosbox_overlay(self, hwnd):
+    def handle_dosbox_overlay(self, state):
         """Manages overlay updates in sync with DOSBox window state."""
-        # Validate window handle and update overlay
-        if win32gui.IsWindow(hwnd) and win32gui.IsWindowVisible(hwnd) and hwnd == win32gui.GetForegroundWindow():
-            self.last_screenshot = capture_window(hwnd)
+        if state.foreground:
+            coords = state.coords
 
-            cropped_screenshot, coords = crop_black_borders_with_coords(self.last_screenshot, self.cropbox)
-
-            if is_in_cockpit_view(cropped_screenshot, self.cockpit_pixels) and self.cockpit_on:
-                # Read dashboard data
-                rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_knob = read_dashboard(cropped_screenshot)
-                self.gs.update(rpm, boost, temp, fuel, mph, gear, f_rollbar, r_rollbar, brake, boost_knob)
+            if state.in_cockpit and self.cockpit_on:
+                # Update from the dashboard data; boost keeps easing towards the reading even on a repeated frame
+                self.gs.update(state.reading)
                 self.cockpit_overlay.setGauges(self.gs.rpm, self.gs.cur_boost, self.gs.temp, self.gs.fuel, self.gs.mph, self.gs.gear, self.gs.f_rollbar, self.gs.r_rollbar, self.gs.brake, self.gs.boost_knob)
-                self.cockpit_overlay.show()
+                self.cockpit_overlay.setOverlayVisible(True)
                 if self.hshifter_on:            
                    self.start_gear_listener()  # Start the gear listener thread
 
             else:
-                self.cockpit_overlay.hide()
+                self.cockpit_overlay.setOverlayVisible(False)
                 if self.hshifter_on:
                     self.stop_gear_listener()  # Stop the gear listener thread
     
-            win_rect = win32gui.GetWindowRect(hwnd)
-            win_x, win_y = win_rect[0], win_rect[1]
-            title_bar_height = get_title_bar_height(hwnd)
-    
             if not self.overlay_locked:
                 self.cockpit_overlay.setPositionAndSize(
-                    coords[0] + win_x + self.x_adjustment, 
-                    coords[1] + win_y + title_bar_height + self.y_adjustment, 
+                    coords[0] + state.window_x + self.x_adjustment, 
+                    coords[1] + state.window_y + self.y_adjustment, 
                     coords[2] - coords[0], 
                     coords[3] - coords[1]
                 )
-
-            self.cockpit_overlay.update()
         else:
-            self.cockpit_overlay.hide()
+            self.cockpit_overlay.setOverlayVisible(False)
             if self.hshifter_on:
                 self.stop_gear_listener()  # Stop the gear listener thread
 
 
     def take_screenshot(self):
         """Take a screenshot of the cropped_screenshot without the overlay."""
-        if self.last_screenshot is not None:
-            cropped_screenshot, _ = crop_black_borders_with_coords(self.last_screenshot)
+        screenshot = self.request_snapshot()
+        if screenshot is not None:
+            cropped_screenshot, _ = crop_black_borders_with_coords(screenshot)
+            # Save at the size the dash_reader.ini coordinates are given in
+            cropped_screenshot = resize_image(Image.fromarray(cropped_screenshot), REFERENCE_WIDTH, REFERENCE_HEIGHT)
             plot = plot_lcd_locations(cropped_screenshot)
             screenshot_path = f'screenshot.png'
             plot.save(screenshot_path)
@@ -1,22 +1,66 @@
-import configparser
-import pygame
+import functools
+import io
+from types import MappingProxyType
 
-def read_cockpit_pixels(icr2dash_ini_path):
-    """Reads cockpit pixel locations from INI file."""
-    config = configparser.ConfigParser()
-    config.optionxform = str
-    config.read(icr2dash_ini_path)
+def on_off(value):
+    """Converts an on/off INI value to a bool."""
+    return value.lower() == 'on'
 
+# Types of the icr2dash.ini settings; anything not listed stays a string
+SETTINGS_TYPES = {
+    'General': {
+        'loop_ms': int,
+        'key_listener_delay': float,
+    },
+    'Boost rise and fall speed': {
+        'boost_drop_rate_per_second': float,
+        'boost_climb_rate_per_second': float,
+    },
+    'Overlay positioning': {
+        'x_adjustment': int,
+        'y_adjustment': int,
+    },
+    'Gear shifting': {
+        'hshifter': on_off,
+        'clutch': on_off,
+        'downshift_delay': float,
+        'upshift_delay': float,
+        'gear_grinding_volume': float,
+    },
+}
+
+def read_settings(config):
+    """Parses icr2dash.ini once into read-only per-section dicts of typed values."""
+    settings = {}
+    for section in config.sections():
+        types = SETTINGS_TYPES.get(section, {})
+        settings[section] = MappingProxyType(
+            {key: types.get(key, str)(value) for key, value in config.items(section)})
+    return MappingProxyType(settings)
+
+def read_cockpit_pixels(settings):
+    """Reads cockpit pixel locations from the settings."""
     cockpit_pixels = {}
-    if 'Cockpit detection' in config.sections():
+    if 'Cockpit detection' in settings:
         # Extract pixel coordinates and RGB values
-        for key in config['Cockpit detection']:
-            values = list(map(int, config.get('Cockpit detection', key).split(',')))
+        for value in settings['Cockpit detection'].values():
+            values = list(map(int, value.split(',')))
             cockpit_pixels[(values[0], values[1])] = tuple(values[2:])
     return cockpit_pixels
 
+@functools.lru_cache(maxsize=None)
+def read_sound_file(path):
+    """Returns the bytes of a sound file, reading each file from disk only once."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+def load_sound(path):
+    """Creates a pygame Sound from a sound file, sharing the file bytes between loads."""
+    import pygame  # Only loaded once the H-shifter needs its sound
+    return pygame.mixer.Sound(file=io.BytesIO(read_sound_file(path)))
+
 def play_gear_grinding_sound(gear_grinding_channel, gear_grinding_sound):
-    """Play the gear grinding sound."""
+    """Play the gear grinding sound unless it is already playing."""
     if not gear_grinding_channel.get_busy():
         gear_grinding_channel.play(gear_grinding_sound)
 
@@ -1,67 +1,209 @@
 # window_capture.py
 
+import ctypes
+from ctypes import wintypes
+import numpy as np
 import win32gui
 import win32ui
 import win32con
-from PIL import Image
 
-def get_title_bar_height(hwnd):
-    client_rect = win32gui.GetClientRect(hwnd)
-    win_rect = win32gui.GetWindowRect(hwnd)
-    
+try:
+    import dxcam
+except ImportError:
+    dxcam = None
+
+WDA_EXCLUDEFROMCAPTURE = 0x11
+
+BI_RGB = 0
+DIB_RGB_COLORS = 0
+
+class BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ('biSize', wintypes.DWORD),
+        ('biWidth', wintypes.LONG),
+        ('biHeight', wintypes.LONG),
+        ('biPlanes', wintypes.WORD),
+        ('biBitCount', wintypes.WORD),
+        ('biCompression', wintypes.DWORD),
+        ('biSizeImage', wintypes.DWORD),
+        ('biXPelsPerMeter', wintypes.LONG),
+        ('biYPelsPerMeter', wintypes.LONG),
+        ('biClrUsed', wintypes.DWORD),
+        ('biClrImportant', wintypes.DWORD),
+    ]
+
+class BITMAPINFO(ctypes.Structure):
+    _fields_ = [('bmiHeader', BITMAPINFOHEADER), ('bmiColors', wintypes.DWORD * 3)]
+
+_gdi32 = ctypes.windll.gdi32
+_gdi32.CreateDIBSection.argtypes = (wintypes.HDC, ctypes.POINTER(BITMAPINFO), wintypes.UINT,
+                                    ctypes.POINTER(ctypes.c_void_p), wintypes.HANDLE, wintypes.DWORD)
+_gdi32.CreateDIBSection.restype = wintypes.HBITMAP
+_gdi32.SelectObject.argtypes = (wintypes.HDC, wintypes.HGDIOBJ)
+_gdi32.SelectObject.restype = wintypes.HGDIOBJ
+_gdi32.DeleteObject.argtypes = (wintypes.HGDIOBJ,)
+
+class WINDOWINFO(ctypes.Structure):
+    _fields_ = [
+        ('cbSize', wintypes.DWORD),
+        ('rcWindow', wintypes.RECT),
+        ('rcClient', wintypes.RECT),
+        ('dwStyle', wintypes.DWORD),
+        ('dwExStyle', wintypes.DWORD),
+        ('dwWindowStatus', wintypes.DWORD),
+        ('cxWindowBorders', wintypes.UINT),
+        ('cyWindowBorders', wintypes.UINT),
+        ('atomWindowType', wintypes.ATOM),
+        ('wCreatorVersion', wintypes.WORD),
+    ]
+
+_user32 = ctypes.windll.user32
+_user32.GetWindowInfo.argtypes = (wintypes.HWND, ctypes.POINTER(WINDOWINFO))
+_user32.GetWindowInfo.restype = wintypes.BOOL
+
+def get_client_area(info):
+    """Returns the client area's x, y within the window and its width and height, from a WINDOWINFO."""
+    win_rect = info.rcWindow
+    width = info.rcClient.right - info.rcClient.left
+    height = info.rcClient.bottom - info.rcClient.top
+
     # Calculate the sizes of the window borders.
-    border_width = (win_rect[2] - win_rect[0] - client_rect[2]) // 2
-    title_bar_height = (win_rect[3] - win_rect[1] - client_rect[3]) - border_width
-    return title_bar_height
+    border_width = (win_rect.right - win_rect.left - width) // 2
+    title_bar_height = (win_rect.bottom - win_rect.top - height) - border_width
+    return border_width, title_bar_height, width, height
+
+def get_window_info(hwnd):
+    """Returns the window and client rects and styles in one call, or None if hwnd is no longer a window."""
+    info = WINDOWINFO()
+    info.cbSize = ctypes.sizeof(WINDOWINFO)
+    if not _user32.GetWindowInfo(hwnd, ctypes.byref(info)):
+        return None
+    return info
 
 def find_dosbox_window():
     def callback(hwnd, extra):
-        title = win32gui.GetWindowText(hwnd)
-        if "DOSBOX" in title.upper() and "INDYCAR" in title.upper():
+        title = win32gui.GetWindowText(hwnd).upper()
+        if "DOSBOX" in title and "INDYCAR" in title:
             extra.append(hwnd)
     hwnds = []
     win32gui.EnumWindows(callback, hwnds)
     return hwnds[0] if hwnds else None
 
 
-def capture_window(hwnd):
-    client_rect = win32gui.GetClientRect(hwnd)
-    win_rect = win32gui.GetWindowRect(hwnd)
+def capture_buffer(out, width, height):
+    """Returns out if it is a width x height BGRX buffer, otherwise a new one."""
+    if out is None or out.shape != (height, width, 4):
+        out = np.empty((height, width, 4), dtype=np.uint8)
+    return out
 
-    # Calculate the sizes of the window borders.
-    border_width = (win_rect[2] - win_rect[0] - client_rect[2]) // 2
-    title_bar_height = (win_rect[3] - win_rect[1] - client_rect[3]) - border_width
-
-    # Capture area dimensions
-    capture_width = client_rect[2]
-    capture_height = client_rect[3]
-
-    # Capture starting point
-    src_x = border_width
-    src_y = title_bar_height
-
-    # Capture the screenshot
-    hwinDC = win32gui.GetWindowDC(hwnd)
-    srcDC = win32ui.CreateDCFromHandle(hwinDC)
-    memDC = srcDC.CreateCompatibleDC()
-    screenshot = win32ui.CreateBitmap()
-    screenshot.CreateCompatibleBitmap(srcDC, capture_width, capture_height)
-    memDC.SelectObject(screenshot)
-    memDC.BitBlt((0, 0), (capture_width, capture_height), srcDC, (src_x, src_y), win32con.SRCCOPY)
-
-    # Convert the resulting image
-    bmpinfo = screenshot.GetInfo()
-    bmpstr = screenshot.GetBitmapBits(True)
-    image = Image.frombuffer(
-        'RGB',
-        (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
-        bmpstr, 'raw', 'BGRX', 0, 1
-    )
-
-    # Cleanup
-    win32gui.DeleteObject(screenshot.GetHandle())
-    memDC.DeleteDC()
-    srcDC.DeleteDC()
-    win32gui.ReleaseDC(hwnd, hwinDC)
-
-    return image
\ No newline at end of file
+class WindowCapture:
+    """Captures a window's client area with GDI BitBlt, keeping the DCs and bitmap from one frame to the next."""
+    def __init__(self):
+        self.key = None
+        self.hwinDC = None
+        self.srcDC = None
+        self.memDC = None
+        self.screenshot = None
+        self.pixels = None
+
+    def open(self, hwnd, capture_width, capture_height):
+        self.hwinDC = win32gui.GetWindowDC(hwnd)
+        self.srcDC = win32ui.CreateDCFromHandle(self.hwinDC)
+        self.memDC = self.srcDC.CreateCompatibleDC()
+
+        # A top-down 32-bit DIB section, so BitBlt writes BGRX rows straight
+        # into memory that numpy can read without GetBitmapBits
+        info = BITMAPINFO()
+        info.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+        info.bmiHeader.biWidth = capture_width
+        info.bmiHeader.biHeight = -capture_height
+        info.bmiHeader.biPlanes = 1
+        info.bmiHeader.biBitCount = 32
+        info.bmiHeader.biCompression = BI_RGB
+        bits = ctypes.c_void_p()
+        self.screenshot = _gdi32.CreateDIBSection(self.memDC.GetSafeHdc(), ctypes.byref(info), DIB_RGB_COLORS, ctypes.byref(bits), None, 0)
+        _gdi32.SelectObject(self.memDC.GetSafeHdc(), self.screenshot)
+        size = capture_width * capture_height * 4
+        self.pixels = np.frombuffer((ctypes.c_ubyte * size).from_address(bits.value), dtype=np.uint8).reshape(capture_height, capture_width, 4)
+
+    def close(self):
+        """Releases the DCs and bitmap, if any are held."""
+        if self.key is None:
+            return
+        # The bitmap can only be deleted once the DC it's selected into is gone
+        self.pixels = None
+        self.memDC.DeleteDC()
+        _gdi32.DeleteObject(self.screenshot)
+        self.srcDC.DeleteDC()
+        win32gui.ReleaseDC(self.key[0], self.hwinDC)
+        self.key = None
+
+    def __call__(self, hwnd, info, out=None):
+        """Captures the client area as an HxWx3 RGB view of a BGRX buffer, reusing out when it is the right size."""
+        # Capture starting point and dimensions
+        src_x, src_y, capture_width, capture_height = get_client_area(info)
+
+        # Only a different window or client size needs new DCs and a new bitmap
+        key = (hwnd, capture_width, capture_height)
+        if key != self.key:
+            self.close()
+            self.open(hwnd, capture_width, capture_height)
+            self.key = key
+
+        # Capture the screenshot
+        self.memDC.BitBlt((0, 0), (capture_width, capture_height), self.srcDC, (src_x, src_y), win32con.SRCCOPY)
+
+        # Copy the DIB's pixels into the buffer once GDI has finished writing
+        # them; reversing the first three channels gives an RGB view without converting
+        _gdi32.GdiFlush()
+        out = capture_buffer(out, capture_width, capture_height)
+        np.copyto(out, self.pixels)
+        return out[:, :, 2::-1]
+
+class DesktopDuplicationCapture:
+    """Captures the DOSBox client area with DXGI Desktop Duplication (through dxcam) instead of GDI."""
+    def __init__(self):
+        # BGRA matches the GDI buffer layout, so grabs copy straight into it
+        self.camera = dxcam.create(output_idx=0, output_color='BGRA')
+        self.window_capture = WindowCapture()
+        self.last_region = None
+        self.last_frame = None
+
+    def __call__(self, hwnd, info, out=None):
+        _, _, width, height = get_client_area(info)
+        left, top = info.rcClient.left, info.rcClient.top
+        region = (left, top, left + width, top + height)
+
+        # Desktop Duplication only sees the primary display, so use GDI off it
+        if left < 0 or top < 0 or region[2] > self.camera.width or region[3] > self.camera.height:
+            return self.window_capture(hwnd, info, out)
+
+        frame = self.camera.grab(region=region)
+        if frame is None:
+            # Nothing on screen changed since the last grab
+            if region != self.last_region:
+                return self.window_capture(hwnd, info, out)
+            frame = self.last_frame
+
+        self.last_region = region
+        self.last_frame = frame
+        out = capture_buffer(out, width, height)
+        np.copyto(out, frame)
+        return out[:, :, 2::-1]
+
+    def close(self):
+        """Releases the GDI fallback's DCs and bitmap."""
+        self.window_capture.close()
+
+def create_capture(capture_method):
+    """Returns the window capturer for the capture_method setting ('gdi' or 'dxgi')."""
+    if capture_method == 'dxgi':
+        if dxcam is None:
+            print('dxcam is not installed, falling back to GDI window capture')
+        else:
+            return DesktopDuplicationCapture()
+    return WindowCapture()
+
+def exclude_from_capture(widget):
+    """Hides a window from screen capture so Desktop Duplication doesn't read the overlay instead of DOSBox."""
+    ctypes.windll.user32.SetWindowDisplayAffinity(int(widget.winId()), WDA_EXCLUDEFROMCAPTURE)